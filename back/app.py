@@ -4,6 +4,7 @@ from flask_migrate import Migrate
 from models import db
 from config import Config
 from routes import register_routes
+from sentence_writer import SentenceWriteBuffer
 
 def create_app():
     app = Flask(__name__)
@@ -15,10 +16,20 @@ def create_app():
     # Initialize Flask-Migrate
     migrate = Migrate(app, db)
     
+    # Inserts the sentences /process_query could not resolve in the background
+    app.extensions['sentence_writer'] = SentenceWriteBuffer(
+        app,
+        max_size=Config.SENTENCE_WRITE_QUEUE_SIZE,
+        batch_size=Config.SENTENCE_WRITE_BATCH_SIZE,
+        flush_interval=Config.SENTENCE_WRITE_INTERVAL
+    )
+    
     register_routes(app)
     
     return app
 
 if __name__ == '__main__':
-    app = create_app()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # The Flask app alone does not serve /process_query and /whisper/transcribe,
+    # the back service only runs through the ASGI app (asgi.py)
+    import uvicorn
+    uvicorn.run('asgi:app', host='0.0.0.0', port=5000, reload=True)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount, Route
+from app import create_app
+from config import Config
+from controllers.async_query_controller import AsyncQueryController
+
+flask_app = create_app()
+async_queries = AsyncQueryController(flask_app)
+
+# The query and transcription endpoints run on the event loop, every other route is
+# served by the Flask app from a thread pool
+app = Starlette(
+    routes=[
+        Route('/process_query', async_queries.process_query, methods=['POST']),
+        Route('/whisper/transcribe', async_queries.transcribe_audio, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=Config.WSGI_THREADS)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=async_queries.lifespan,
+)
+
+if __name__ == '__main__':
+    if Config.ASGI_WORKERS > 1 and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        # The workers import the app again with this set, and /metrics merges their files
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus_')
+    uvicorn.run('asgi:app', host='0.0.0.0', port=5000, workers=Config.ASGI_WORKERS)
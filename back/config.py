@@ -6,4 +6,51 @@ class Config:
         'postgresql://postgres:postgres@db:5432/myapp'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
\ No newline at end of file
+    SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
+
+    # Route search budgets per endpoint: seconds of wall-clock time and settled
+    # nodes (scanned connections for the timetable). 0 disables a limit.
+    PROCESS_QUERY_TIME_BUDGET = float(os.getenv('PROCESS_QUERY_TIME_BUDGET', '2.0'))
+    PROCESS_QUERY_NODE_BUDGET = int(os.getenv('PROCESS_QUERY_NODE_BUDGET', '0'))
+    TIMETABLE_TIME_BUDGET = float(os.getenv('TIMETABLE_TIME_BUDGET', '2.0'))
+    TIMETABLE_NODE_BUDGET = int(os.getenv('TIMETABLE_NODE_BUDGET', '0'))
+
+    # Call NER while NLU is still classifying the query, the NER answer is dropped
+    # for non travel queries
+    CONCURRENT_NLU_NER = os.getenv('CONCURRENT_NLU_NER', 'true').lower() == 'true'
+
+    # Identical /process_query requests (same text once normalized and same models)
+    # in flight at the same time wait for one computation and share its answer
+    COALESCE_QUERIES = os.getenv('COALESCE_QUERIES', 'true').lower() == 'true'
+
+    # /process_query responses cached across workers: sqlite (one file per host),
+    # redis or none. Keys hold the model names and versions and the GTFS files hash, so
+    # a reloaded model or a new timetable never gets a stale answer. Model versions are
+    # fetched from the services at most every QUERY_CACHE_VERSION_REFRESH seconds.
+    QUERY_CACHE_BACKEND = os.getenv('QUERY_CACHE_BACKEND', 'sqlite').lower()
+    QUERY_CACHE_PATH = os.getenv('QUERY_CACHE_PATH', '/tmp/travel_resolver/query_cache.sqlite')
+    QUERY_CACHE_REDIS_URL = os.getenv('QUERY_CACHE_REDIS_URL', 'redis://redis:6379/0')
+    QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '3600'))
+    QUERY_CACHE_MAX_SIZE = int(os.getenv('QUERY_CACHE_MAX_SIZE', '10000'))
+    QUERY_CACHE_VERSION_REFRESH = float(os.getenv('QUERY_CACHE_VERSION_REFRESH', '5'))
+
+    # Internal services, each called through a pool of keep-alive connections.
+    # Failed calls are retried SERVICE_RETRIES times with exponential backoff.
+    NER_SERVICE_URL = os.getenv('NER_SERVICE_URL', 'http://ner:5001')
+    NLU_SERVICE_URL = os.getenv('NLU_SERVICE_URL', 'http://nlu:5002')
+    WHISPER_SERVICE_URL = os.getenv('WHISPER_SERVICE_URL', 'http://whisper:5003')
+    NER_POOL_SIZE = int(os.getenv('NER_POOL_SIZE', '16'))
+    NLU_POOL_SIZE = int(os.getenv('NLU_POOL_SIZE', '16'))
+    WHISPER_POOL_SIZE = int(os.getenv('WHISPER_POOL_SIZE', '4'))
+    SERVICE_RETRIES = int(os.getenv('SERVICE_RETRIES', '2'))
+    SERVICE_RETRY_BACKOFF = float(os.getenv('SERVICE_RETRY_BACKOFF', '0.2'))
+
+    # Sentences /process_query could not resolve are queued and inserted in batches
+    # by a background thread. New ones are dropped while the queue is full.
+    SENTENCE_WRITE_QUEUE_SIZE = int(os.getenv('SENTENCE_WRITE_QUEUE_SIZE', '10000'))
+    SENTENCE_WRITE_BATCH_SIZE = int(os.getenv('SENTENCE_WRITE_BATCH_SIZE', '100'))
+    SENTENCE_WRITE_INTERVAL = float(os.getenv('SENTENCE_WRITE_INTERVAL', '1.0'))
+
+    # asgi.py: uvicorn processes, and threads serving the Flask routes in each of them
+    ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '2'))
+    WSGI_THREADS = int(os.getenv('WSGI_THREADS', '10'))
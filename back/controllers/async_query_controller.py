@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import httpx
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from config import Config
+from service_clients import create_async_service_client
+from single_flight import AsyncSingleFlight
+from metrics import StageTimer, stage
+from model_versions import ModelVersions
+from controllers.train_mapper_controller import TrainMapperController
+
+class AsyncQueryController:
+    """
+    /process_query and /whisper/transcribe served on the event loop.
+
+    Calls to the ML services are awaited instead of holding a thread. Only the route
+    search and the database write go to the thread pool, inside a Flask app context.
+    """
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.controller = None
+        self.clients = {}
+        self.model_versions = None
+        self.queries_in_flight = AsyncSingleFlight()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app):
+        # Load the timetable graph before accepting queries
+        self.controller = await run_in_threadpool(TrainMapperController)
+        self.clients = {name: create_async_service_client(name) for name in ('ner', 'nlu', 'whisper')}
+        self.model_versions = ModelVersions(self.clients, Config.QUERY_CACHE_VERSION_REFRESH)
+        try:
+            yield
+        finally:
+            for client in self.clients.values():
+                await client.close()
+            # Write the queued sentences before the worker exits
+            await run_in_threadpool(self.flask_app.extensions['sentence_writer'].stop)
+
+    async def _post_json(self, service, path, payload, timer=None):
+        # A body that is not JSON raises ValueError (json.JSONDecodeError)
+        with stage(timer, service):
+            response = await self.clients[service].post(path, json=payload)
+            response.raise_for_status()
+            result = response.json()
+        if isinstance(result, dict):
+            self.model_versions.update(service, payload.get('model_name'), result.get('model_version'))
+        return result
+
+    def _build_response(self, text, nlu_result, ner_result, timer):
+        with self.flask_app.app_context():
+            return self.controller.build_response(text, nlu_result, ner_result, timer)
+
+    async def process_query(self, request):
+        try:
+            data = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "Request body must be valid JSON"}, status_code=400)
+        if not isinstance(data, dict) or not isinstance(data.get('text', ''), str):
+            return JSONResponse({"error": "Request body must be an object with a text string"}, status_code=400)
+        if not all(isinstance(data.get(name) or '', str) for name in ('nlu', 'ner', 'joint')):
+            return JSONResponse({"error": "Model names must be strings"}, status_code=400)
+
+        timer = StageTimer()
+
+        with timer.stage('cache'):
+            await self.model_versions.refresh()
+            key = self.controller.query_key(data, self.model_versions)
+            cached = await run_in_threadpool(self.controller.get_cached_response, key)
+        if cached is not None:
+            body, status = cached, 200
+        else:
+            if Config.COALESCE_QUERIES:
+                # Identical queries arriving together share one NLU/NER/route search run
+                body, status, durations = await self.queries_in_flight.do(key, lambda: self._answer_and_cache_query(data, key))
+            else:
+                body, status, durations = await self._answer_and_cache_query(data, key)
+            # Every request waiting for the run reports its stages
+            timer.durations.update(durations)
+
+        timer.observe()
+        return JSONResponse(body, status_code=status, headers={'Server-Timing': timer.server_timing()})
+
+    async def _answer_and_cache_query(self, data, key):
+        """Body, status and stage durations of a query, shared by the coalesced requests"""
+        timer = StageTimer()
+        body, status = await self._answer_query(data, timer)
+        if status == 200:
+            # Keyed on the versions of the models that answered, they may be newer
+            key = self.controller.query_key(data, self.model_versions)
+            await run_in_threadpool(self.controller.cache_response, key, body)
+        return body, status, timer.durations
+
+    async def _answer_query(self, data, timer=None):
+        text, nlu_call, ner_call = self.controller.build_service_calls(data)
+
+        ner_task = None
+        if ner_call is not None and Config.CONCURRENT_NLU_NER:
+            # Start NER now so the query waits for the slowest service instead of both
+            ner_task = asyncio.create_task(self._post_json('ner', *ner_call, timer))
+            # An unused NER answer or error must not be reported as never retrieved
+            ner_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        # Call NLU service
+        try:
+            nlu_result = await self._post_json('nlu', *nlu_call, timer)
+        except (httpx.HTTPError, ValueError) as e:
+            if ner_task is not None:
+                ner_task.cancel()
+            return {"error": f"NLU service error: {str(e)}"}, 500
+
+        ner_result = None
+        if not self.controller.is_travel_related(nlu_result):
+            if ner_task is not None:
+                ner_task.cancel()
+        elif ner_call is None:
+            ner_result = nlu_result
+        else:
+            # Call NER service, or wait for the call started with NLU
+            try:
+                if ner_task is not None:
+                    ner_result = await ner_task
+                else:
+                    ner_result = await self._post_json('ner', *ner_call, timer)
+            except (httpx.HTTPError, ValueError) as e:
+                return {"error": f"NER service error: {str(e)}"}, 500
+
+        response = await run_in_threadpool(self._build_response, text, nlu_result, ner_result, timer)
+        return response, 200
+
+    async def transcribe_audio(self, request):
+        form = await request.form()
+        audio_file = form.get('file')
+        if audio_file is None or isinstance(audio_file, str):
+            return JSONResponse({"error": "No file provided"}, status_code=400)
+
+        try:
+            response = await self.clients['whisper'].post(
+                '/transcribe',
+                files={'file': (audio_file.filename, await audio_file.read(), audio_file.content_type)}
+            )
+            response.raise_for_status()
+
+            data = response.json()
+            return JSONResponse({"transcript": data.get("transcript", "")})
+
+        except (httpx.HTTPError, ValueError) as e:
+            return JSONResponse({"error": f"Whisper service error: {str(e)}"}, status_code=500)
@@ -1,9 +1,11 @@
 import os
 import json
-import requests
+import hashlib
 from pathfinder.TrainRouteMapper import TrainRouteMapper
-from flask import jsonify, request
-from models import db, Sentence
+from flask import current_app, jsonify, request
+from config import Config
+from query_cache import create_query_cache
+from metrics import stage
 
 class ModelManager:
     _instance = None
@@ -12,85 +14,146 @@ class ModelManager:
         if cls._instance is None:
             cls._instance = super(ModelManager, cls).__new__(cls)
             cls._instance._initialize_mapper()
+            cls._instance.query_cache = create_query_cache()
         return cls._instance
     
     def _initialize_mapper(self):
         # Initialize TrainRouteMapper
         stops_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pathfinder', 'tgv', 'stops.txt'))
         stop_times_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pathfinder', 'tgv', 'stop_times.txt'))
-        self.mapper = TrainRouteMapper(stops_file, stop_times_file)
+        transfers_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pathfinder', 'tgv', 'transfers.txt'))
+        trips_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pathfinder', 'tgv', 'trips.txt'))
+        routes_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pathfinder', 'tgv', 'routes.txt'))
+        gtfs_files = [stops_file, stop_times_file, transfers_file, trips_file, routes_file]
+        self.mapper = TrainRouteMapper(*gtfs_files)
+        self.gtfs_version = self._hash_files(gtfs_files)
+
+    @staticmethod
+    def _hash_files(paths):
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()[:16]
 
 class TrainMapperController:
+    """
+    Route search and the /process_query steps that do not call the ML services.
+    The query pipeline itself is AsyncQueryController.process_query.
+    """
     def __init__(self):
         self.model_manager = ModelManager()
-        # Use service names from docker-compose
-        self.ner_service_url = "http://ner:5001/predict"
-        self.nlu_service_url = "http://nlu:5002/predict"
-    
-    def process_query(self):
-        data = request.json
-        text = data.get('text', '').lower()
-        nlu_model_name = data.get('nlu')
-        ner_model_name = data.get('ner')
-        
-        # Call NLU service
+
+    @staticmethod
+    def normalize_text(text):
+        return ' '.join(text.lower().split())
+
+    def query_key(self, data, model_versions):
+        """Queries with the same key get the same answer"""
+        return (
+            self.normalize_text(data.get('text', '')),
+            data.get('nlu'),
+            data.get('ner'),
+            data.get('joint'),
+            model_versions.get('nlu', data.get('nlu')),
+            model_versions.get('ner', data.get('ner')),
+            model_versions.get('nlu', data.get('joint')),
+            self.model_manager.gtfs_version
+        )
+
+    def get_cached_response(self, key):
+        if self.model_manager.query_cache is None:
+            return None
         try:
-            nlu_response = requests.post(
-                self.nlu_service_url,
-                json={"text": text, "model_name": nlu_model_name},
-                timeout=5
-            )
-            nlu_response.raise_for_status()
-            nlu_result = nlu_response.json()
-            
-            is_travel_related = nlu_result['label'] == 'LABEL_0'
-            
-            response = {
-                "is_travel_related": is_travel_related,
-                "confidence": nlu_result['confidence']
-            }
+            return self.model_manager.query_cache.get(key)
+        except Exception as e:
+            # An unavailable cache only costs the full pipeline
+            print(f"Query cache read failed: {str(e)}")
+            return None
 
-            if is_travel_related:
-                # Call NER service
-                try:
-                    ner_response = requests.post(
-                        self.ner_service_url,
-                        json={"text": text, "model_name": ner_model_name},
-                        timeout=5
-                    )
-                    ner_response.raise_for_status()
-                    ner_result = ner_response.json()
-                    
-                    depart = ner_result.get("departure")
-                    arrivee = ner_result.get("arrival")
+    def cache_response(self, key, response):
+        if self.model_manager.query_cache is None:
+            return
+        # A route search cut short by its budget (under load) would be served to every
+        # worker for the whole TTL
+        if response.get("trip_info", {}).get("partial"):
+            return
+        try:
+            self.model_manager.query_cache.put(key, response)
+        except Exception as e:
+            print(f"Query cache write failed: {str(e)}")
 
-                    if not depart and not arrivee:
-                        response["error"] = "Unable to identify departure and arrival city"
-                    elif not depart:
-                        response["error"] = f"Found {arrivee} as arrival but unable to identify departure city"
-                    elif not arrivee:
-                        response["error"] = f"Found {depart} as departure but unable to identify arrival city"
-                    else:
-                        trip_info = json.loads(self.model_manager.mapper.find_shorter_paths(depart, arrivee))
-                        response.update({
-                            "departure": depart,
-                            "arrival": arrivee,
-                            "trip_info": trip_info
-                        })
-                except requests.RequestException as e:
-                    return jsonify({"error": f"NER service error: {str(e)}"}), 500
-                    
-        except requests.RequestException as e:
-            return jsonify({"error": f"NLU service error: {str(e)}"}), 500
+    def build_service_calls(self, data):
+        """Text and (path, payload) of the NLU and NER calls for a /process_query body"""
+        text = self.normalize_text(data.get('text', ''))
+        joint_model_name = data.get('joint')
+        if joint_model_name:
+            # A joint model answers the intent and the cities in one call, replacing nlu and ner
+            return text, ('/predict/joint', {"text": text, "model_name": joint_model_name}), None
+        
+        nlu_call = ('/predict', {"text": text, "model_name": data.get('nlu')})
+        # NLU already classifies the sentence, the NER language check is redundant
+        ner_call = ('/predict', {"text": text, "model_name": data.get('ner'), "check_language": False})
+        return text, nlu_call, ner_call
+
+    @staticmethod
+    def is_travel_related(nlu_result):
+        return nlu_result['label'] == 'LABEL_0'
+
+    def build_response(self, text, nlu_result, ner_result, timer=None):
+        """Response for a classified query, with the route search when both cities were found"""
+        is_travel_related = self.is_travel_related(nlu_result)
+        
+        response = {
+            "is_travel_related": is_travel_related,
+            "confidence": nlu_result['confidence']
+        }
+
+        if is_travel_related:
+            depart = ner_result.get("departure")
+            arrivee = ner_result.get("arrival")
+
+            if not depart and not arrivee:
+                response["error"] = "Unable to identify departure and arrival city"
+            elif not depart:
+                response["error"] = f"Found {arrivee} as arrival but unable to identify departure city"
+            elif not arrivee:
+                response["error"] = f"Found {depart} as departure but unable to identify arrival city"
+            else:
+                trip_json = self.model_manager.mapper.find_shorter_paths(
+                    depart,
+                    arrivee,
+                    time_budget=Config.PROCESS_QUERY_TIME_BUDGET,
+                    node_budget=Config.PROCESS_QUERY_NODE_BUDGET,
+                    timer=timer
+                )
+                with stage(timer, 'formatting'):
+                    trip_info = json.loads(trip_json)
+                response.update({
+                    "departure": depart,
+                    "arrival": arrivee,
+                    "trip_info": trip_info
+                })
         
         if(not "trip_info" in response):
-            new_sentence = Sentence(
-                text=text,
-                is_valid=False,
-                is_treated=False
-            )
+            # Recorded for review by a background thread, off the request path
+            with stage(timer, 'db_write'):
+                current_app.extensions['sentence_writer'].add(text)
             
-            db.session.add(new_sentence)
-            db.session.commit()
-            
-        return jsonify(response)
\ No newline at end of file
+        return response
+
+    def get_timetable(self):
+        start_name = request.args.get('from', '').lower()
+        end_name = request.args.get('to', '').lower()
+
+        if not start_name or not end_name:
+            return jsonify({"error": "Missing required parameters"}), 400
+
+        timetable = json.loads(self.model_manager.mapper.find_profile(
+            start_name,
+            end_name,
+            time_budget=Config.TIMETABLE_TIME_BUDGET,
+            node_budget=Config.TIMETABLE_NODE_BUDGET
+        ))
+        return jsonify(timetable)
@@ -0,0 +1,71 @@
+import contextlib
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest, multiprocess, REGISTRY
+)
+
+# Stages of /process_query, in pipeline order
+STAGES = ['cache', 'nlu', 'ner', 'station_lookup', 'fuzzy_match', 'path_search', 'formatting', 'db_write']
+
+STAGE_DURATION = Histogram(
+    'process_query_stage_duration_seconds',
+    'Time spent in each /process_query stage',
+    ['stage'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+QUERY_DURATION = Histogram(
+    'process_query_duration_seconds',
+    'Time to answer a /process_query request',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+SENTENCE_WRITE_DURATION = Histogram(
+    'sentence_write_batch_duration_seconds',
+    'Time to insert one batch of unresolved sentences'
+)
+
+class StageTimer:
+    """
+    Durations of the stages of one query. A stage entered several times (one path
+    search per station pair) adds up, stages run concurrently (NLU and NER) overlap.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def observe(self):
+        """Records the durations in the Prometheus histograms"""
+        for name, duration in self.durations.items():
+            STAGE_DURATION.labels(name).observe(duration)
+        QUERY_DURATION.observe(time.perf_counter() - self.start)
+
+    def server_timing(self):
+        """Server-Timing header value, in milliseconds"""
+        durations = [
+            f"{name};dur={self.durations[name] * 1000:.1f}"
+            for name in STAGES + sorted(set(self.durations) - set(STAGES))
+            if name in self.durations
+        ]
+        durations.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ', '.join(durations)
+
+def stage(timer, name):
+    """timer.stage(name), or nothing when the caller does not time the query"""
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
+
+def render_metrics():
+    """Body and content type of /metrics, merged across the uvicorn workers if there are several"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,47 @@
+import asyncio
+import time
+import httpx
+from single_flight import AsyncSingleFlight
+
+class ModelVersions:
+    """
+    Versions of the NLU and NER models (hash of their files) last reported by the
+    services. They are part of the query cache key, so a model reloaded with new
+    weights stops getting the answers of the previous ones.
+
+    Refreshed from GET /models/versions at most every refresh_interval seconds, and
+    from the model_version of every /predict answer. Calls must come from one event loop.
+    """
+    def __init__(self, clients, refresh_interval, services=('nlu', 'ner')):
+        self.clients = clients
+        self.refresh_interval = refresh_interval
+        self.services = services
+        self.versions = {}
+        self.refreshed_at = None
+        self.refreshes = AsyncSingleFlight()
+
+    def get(self, service, model_name):
+        return self.versions.get((service, model_name))
+
+    def update(self, service, model_name, version):
+        if model_name and version is not None:
+            self.versions[(service, model_name)] = version
+
+    async def refresh(self):
+        if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_interval:
+            return
+        await self.refreshes.do('refresh', self._fetch)
+
+    async def _fetch(self):
+        await asyncio.gather(*(self._fetch_service(service) for service in self.services))
+        self.refreshed_at = time.monotonic()
+
+    async def _fetch_service(self, service):
+        try:
+            response = await self.clients[service].get('/models/versions')
+            response.raise_for_status()
+            for model_name, version in response.json().items():
+                self.update(service, model_name, version)
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            # Keys keep the last known versions, cached answers are still served
+            print(f"Could not fetch the {service} model versions: {str(e)}")
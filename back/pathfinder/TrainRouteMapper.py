@@ -1,33 +1,80 @@
 import pandas as pd
 import networkx as nx
 from collections import defaultdict
+import bisect
+import heapq
 import itertools
-import datetime
 import json
+import os
+import time
 from pyxdameraulevenshtein import damerau_levenshtein_distance
 from models import City
+from metrics import stage
+
+# Times are int seconds since the start of the service day; GTFS allows values past 24:00:00
+SECONDS_PER_DAY = 24 * 3600
+
+# Used for every station when transfers.txt gives no explicit minimum time (seconds)
+DEFAULT_MIN_TRANSFER_TIME = 10 * 60
+
+class SearchBudget:
+    """Wall-clock and settled-node limits shared by every search of one request."""
+
+    def __init__(self, time_budget=None, node_budget=None):
+        self.deadline = time.monotonic() + time_budget if time_budget else None
+        self.node_budget = node_budget or None
+        self.settled = 0
+        self.exceeded = False
+
+    def settle(self):
+        """Count one settled node (or scanned connection), return False once a limit is hit."""
+        self.settled += 1
+        if self.node_budget and self.settled > self.node_budget:
+            self.exceeded = True
+        elif self.deadline and time.monotonic() > self.deadline:
+            self.exceeded = True
+        return not self.exceeded
 
 class TrainRouteMapper:
-    def __init__(self, stops_file, stop_times_file):
+    def __init__(self, stops_file, stop_times_file, transfers_file=None, trips_file=None, routes_file=None):
         self.G = nx.DiGraph()
         self.stops = self._read_gtfs_file(stops_file)
         self.stop_times = self._read_gtfs_file(stop_times_file)
+        self.transfers = self._read_optional_gtfs_file(transfers_file)
+        self.trips_data = self._read_optional_gtfs_file(trips_file)
+        self.routes_data = self._read_optional_gtfs_file(routes_file)
         self._process_stops()
         self._process_trips()
+        self._process_trip_metadata()
+        self._process_transfers()
         self._create_graph()
+        self._create_connections()
 
     def _parse_time(self, time_str):
         hours, minutes, seconds = map(int, time_str.split(':'))
-        return datetime.timedelta(hours=hours, minutes=minutes, seconds=seconds)
+        return hours * 3600 + minutes * 60 + seconds
 
     def _read_gtfs_file(self, filename):
         df = pd.read_csv(filename, dtype=str)
         if 'arrival_time' in df.columns and 'departure_time' in df.columns:
-            df['arrival_time'] = df['arrival_time'].apply(self._parse_time)
-            df['departure_time'] = df['departure_time'].apply(self._parse_time)
+            df['arrival_time'] = df['arrival_time'].apply(self._parse_time).astype('int32')
+            df['departure_time'] = df['departure_time'].apply(self._parse_time).astype('int32')
         return df
 
-    def _format_duration(self, minutes):
+    def _read_optional_gtfs_file(self, filename):
+        if filename and os.path.exists(filename):
+            return self._read_gtfs_file(filename)
+        return None
+
+    def _clean_value(self, value):
+        return value if pd.notna(value) and value else None
+
+    def _format_time(self, seconds):
+        seconds %= SECONDS_PER_DAY
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+    def _format_duration(self, seconds):
+        minutes = seconds // 60
         if minutes >= 60:
             hours = int(minutes // 60)
             remaining_minutes = int(minutes % 60)
@@ -37,142 +84,305 @@ class TrainRouteMapper:
 
     def _process_stops(self):
         self.stops = self.stops.to_dict('records')
-        print(f"Loaded {len(self.stops)} stops")
+        # StopPoints are collapsed into their parent StopArea: the search only sees stations
+        self.parent_stations = {}
+        self.stations = {}
+        for stop in self.stops:
+            parent_station = stop.get('parent_station')
+            if pd.notna(parent_station) and parent_station:
+                self.parent_stations[stop['stop_id']] = parent_station
+                continue
+            try:
+                self.stations[stop['stop_id']] = {
+                    'name': stop.get('stop_name', 'Unknown'),
+                    'lat': float(stop['stop_lat']),
+                    'lon': float(stop['stop_lon'])
+                }
+            except (KeyError, ValueError):
+                print(f"Warning: Invalid coordinates for stop {stop['stop_id']}")
+        print(f"Loaded {len(self.stops)} stops ({len(self.stations)} stations)")
+
+    def _get_station(self, stop_id):
+        return self.parent_stations.get(stop_id, stop_id)
 
     def _process_trips(self):
-        self.trips = defaultdict(list)
+        stops_by_trip = defaultdict(list)
         for _, row in self.stop_times.iterrows():
-            self.trips[row['trip_id']].append({
+            stops_by_trip[row['trip_id']].append({
                 'stop_id': row['stop_id'],
                 'stop_sequence': int(row['stop_sequence']),
-                'arrival_time': row['arrival_time'],
-                'departure_time': row['departure_time']
+                'arrival_time': int(row['arrival_time']),
+                'departure_time': int(row['departure_time'])
             })
+
+        # Trips are referred to by integer index in the graph, connections and metadata
+        self.trip_ids = list(stops_by_trip)
+        self.trip_indexes = {trip_id: index for index, trip_id in enumerate(self.trip_ids)}
+        self.trips = [sorted(stops_by_trip[trip_id], key=lambda x: x['stop_sequence']) for trip_id in self.trip_ids]
         print(f"Loaded {len(self.trips)} trips")
 
+    def _process_trip_metadata(self):
+        # trip index -> route name, headsign and train number, joined once instead of per request
+        self.trip_metadata = [
+            {'route_name': None, 'route_short_name': None, 'headsign': None, 'train_number': None}
+            for _ in self.trip_ids
+        ]
+        if self.trips_data is None:
+            print("No trips file found, legs will only expose trip ids")
+            return
+
+        routes = {}
+        if self.routes_data is not None:
+            routes = {route['route_id']: route for route in self.routes_data.to_dict('records')}
+
+        for trip in self.trips_data.to_dict('records'):
+            index = self.trip_indexes.get(trip['trip_id'])
+            if index is None:
+                continue
+            route = routes.get(trip.get('route_id'), {})
+            route_short_name = self._clean_value(route.get('route_short_name'))
+            headsign = self._clean_value(trip.get('trip_headsign'))
+            self.trip_metadata[index] = {
+                'route_name': self._clean_value(route.get('route_long_name')) or route_short_name,
+                'route_short_name': route_short_name,
+                'headsign': headsign,
+                # SNCF feeds carry the train number in the headsign when trip_short_name is absent
+                'train_number': self._clean_value(trip.get('trip_short_name')) or headsign
+            }
+        print(f"Loaded metadata for {len(self.trips_data)} trips and {len(routes)} routes")
+
+    def _process_transfers(self):
+        # from_station -> {to_station: minimum transfer time, or None when the transfer is forbidden}
+        self.min_transfer_times = defaultdict(dict)
+        if self.transfers is not None:
+            for transfer in self.transfers.to_dict('records'):
+                from_station = self._get_station(transfer['from_stop_id'])
+                to_station = self._get_station(transfer['to_stop_id'])
+                min_transfer_time = transfer.get('min_transfer_time')
+                if transfer.get('transfer_type') == '3':
+                    min_transfer_time = None
+                elif pd.notna(min_transfer_time) and min_transfer_time:
+                    min_transfer_time = int(min_transfer_time)
+                else:
+                    min_transfer_time = DEFAULT_MIN_TRANSFER_TIME
+
+                # Several StopPoint pairs can map to the same stations, keep the safest rule
+                known = self.min_transfer_times[from_station]
+                if to_station in known and (known[to_station] is None or
+                                            (min_transfer_time is not None and known[to_station] >= min_transfer_time)):
+                    continue
+                known[to_station] = min_transfer_time
+            print(f"Loaded {len(self.transfers)} transfers")
+
+        for station_id in self.stations:
+            self.min_transfer_times[station_id].setdefault(station_id, DEFAULT_MIN_TRANSFER_TIME)
+
+    def _next_departure(self, events, times, time):
+        """First (time, node, day_offset) departing at or after time, possibly on the next service day."""
+        index = bisect.bisect_left(times, time)
+        best = (times[index], events[index][1], 0) if index < len(times) else None
+        index = bisect.bisect_left(times, time - SECONDS_PER_DAY)
+        if index < len(times) and (best is None or times[index] + SECONDS_PER_DAY < best[0]):
+            best = (times[index] + SECONDS_PER_DAY, events[index][1], 1)
+        return best
+
     def _create_graph(self):
-        for stop in self.stops:
-            if 'stop_lat' in stop and 'stop_lon' in stop:
-                try:
-                    self.G.add_node(stop['stop_id'],
-                                    lat=float(stop['stop_lat']),
-                                    lon=float(stop['stop_lon']),
-                                    name=stop.get('stop_name', 'Unknown'))
-                except ValueError:
-                    print(f"Warning: Invalid coordinates for stop {stop['stop_id']}")
-
-        for trip_id, stops_in_trip in self.trips.items():
-            sorted_stops = sorted(stops_in_trip, key=lambda x: x['stop_sequence'])
-            for i in range(len(sorted_stops) - 1):
-                start = sorted_stops[i]
-                end = sorted_stops[i+1]
-                duration = (end['arrival_time'] - start['departure_time']).total_seconds() / 60
-                self.G.add_edge(start['stop_id'], end['stop_id'], 
-                                weight=duration, 
-                                trip_id=trip_id,
-                                departure_time=start['departure_time'],
-                                arrival_time=end['arrival_time'])
+        """
+        Build a time-expanded graph at station level.
+
+        Every stop of a trip gives an arrival node ('arr', trip_index, index), a departure
+        node ('dep', trip_index, index) and a waiting node ('wait', trip_index, index) on the
+        platform. Waiting nodes of a station are chained in departure order and each one
+        boards its trip. Passengers staying on board go straight from the arrival to the
+        departure node, the others are linked to the first waiting node reachable after
+        the minimum transfer time, so a path through the graph is always a feasible journey.
+        ('from', station) and ('to', station) nodes are the search endpoints.
+
+        Weights are int seconds. Waiting and transfer edges may roll over to the next
+        service day, in which case they carry day_offset=1.
+        """
+        departures = defaultdict(list)
+        arrivals = defaultdict(list)
+        # Station of each trip stop, and to_station -> {from_station: shortest ride} giving
+        # the search lower bounds
+        self.trip_stations = [[self._get_station(stop['stop_id']) for stop in stops] for stops in self.trips]
+        self.min_ride_times = defaultdict(dict)
+
+        for trip_index, sorted_stops in enumerate(self.trips):
+            last = len(sorted_stops) - 1
+            for i, stop in enumerate(sorted_stops):
+                station = self._get_station(stop['stop_id'])
+                arrival_node = ('arr', trip_index, i)
+                departure_node = ('dep', trip_index, i)
+                wait_node = ('wait', trip_index, i)
+
+                if i > 0:
+                    arrivals[station].append((stop['arrival_time'], arrival_node))
+                    self.G.add_edge(arrival_node, ('to', station), weight=0, kind='alight')
+                if i < last:
+                    departures[station].append((stop['departure_time'], wait_node))
+                    self.G.add_edge(('from', station), departure_node, weight=0, kind='board')
+                    self.G.add_edge(wait_node, departure_node, weight=0, kind='board')
+                if 0 < i < last:
+                    # Staying on board never requires a transfer, and never reaches the
+                    # waiting nodes: other trips are only boarded through a transfer edge
+                    dwell = stop['departure_time'] - stop['arrival_time']
+                    self.G.add_edge(arrival_node, departure_node, weight=dwell, kind='dwell', trip_index=trip_index)
+                if i < last:
+                    end = sorted_stops[i+1]
+                    duration = end['arrival_time'] - stop['departure_time']
+                    next_station = self.trip_stations[trip_index][i+1]
+                    known = self.min_ride_times[next_station]
+                    known[station] = min(duration, known.get(station, duration))
+                    self.G.add_edge(departure_node, ('arr', trip_index, i+1),
+                                    weight=duration,
+                                    kind='ride',
+                                    trip_index=trip_index,
+                                    from_station=station,
+                                    to_station=next_station,
+                                    departure_time=stop['departure_time'],
+                                    arrival_time=end['arrival_time'])
+
+        departure_times = {}
+        for station, events in departures.items():
+            events.sort(key=lambda x: x[0])
+            times = departure_times[station] = [time for time, _ in events]
+            for (time, node), (next_time, next_node) in zip(events, events[1:]):
+                self.G.add_edge(node, next_node, weight=next_time - time, kind='wait', day_offset=0)
+            # The last departure of the day waits for the next day's service
+            index = bisect.bisect_left(times, times[-1] - SECONDS_PER_DAY)
+            if index < len(events) - 1:
+                self.G.add_edge(events[-1][1], events[index][1],
+                                weight=times[index] + SECONDS_PER_DAY - times[-1],
+                                kind='wait',
+                                day_offset=1)
+
+        for station, events in arrivals.items():
+            for to_station, min_transfer_time in self.min_transfer_times.get(station, {}).items():
+                if min_transfer_time is None or to_station not in departures:
+                    continue
+                if to_station != station:
+                    self.min_ride_times[to_station][station] = 0
+                for time, node in events:
+                    next_time, next_node, day_offset = self._next_departure(
+                        departures[to_station], departure_times[to_station], time + min_transfer_time
+                    )
+                    self.G.add_edge(node, next_node,
+                                    weight=next_time - time,
+                                    kind='transfer',
+                                    day_offset=day_offset)
+
+        print(f"Created graph with {self.G.number_of_nodes()} nodes and {self.G.number_of_edges()} edges")
+
+    def _create_connections(self):
+        # (departure, arrival, from_station, to_station, trip_index, index in trip, day), sorted by departure.
+        # Trips run on two consecutive service days so scans can span into the next day.
+        self.connections = []
+        for day in (0, 1):
+            offset = day * SECONDS_PER_DAY
+            for trip_index, sorted_stops in enumerate(self.trips):
+                for i in range(len(sorted_stops) - 1):
+                    start = sorted_stops[i]
+                    end = sorted_stops[i+1]
+                    self.connections.append((start['departure_time'] + offset,
+                                             end['arrival_time'] + offset,
+                                             self._get_station(start['stop_id']),
+                                             self._get_station(end['stop_id']),
+                                             trip_index,
+                                             i,
+                                             day))
+        self.connections.sort(key=lambda x: (x[0], x[1]))
+        self.connection_departures = [connection[0] for connection in self.connections]
+        # Last first-day departure of each station, where the journeys of a timetable end
+        self.last_departures = {}
+        for departure, _, from_station, _, _, _, day in self.connections:
+            if day == 0:
+                self.last_departures[from_station] = departure
+        print(f"Created {len(self.connections)} connections")
 
     def find_stations(self, name):
-        return [stop['stop_id'] for stop in self.stops if stop.get('stop_name', '').lower().startswith(name.lower())]
+        return [station_id for station_id, station in self.stations.items() if station['name'].lower().startswith(name.lower())]
 
     def get_path_info(self, path):
         total_duration = 0
+        day_offset = 0
         segments = []
         for i in range(len(path) - 1):
             edge_data = self.G.get_edge_data(path[i], path[i+1])
-            if edge_data:
-                if isinstance(edge_data, dict):
-                    duration = edge_data['weight']
-                    departure_time = edge_data['departure_time']
-                    arrival_time = edge_data['arrival_time']
-                    trip_id = edge_data['trip_id']
-                elif isinstance(edge_data, list):
-                    duration = edge_data[0]['weight']
-                    departure_time = edge_data[0]['departure_time']
-                    arrival_time = edge_data[0]['arrival_time']
-                    trip_id = edge_data[0]['trip_id']
-                else:
-                    print(f"Unexpected edge data format: {edge_data}")
-                    continue
+            if not edge_data:
+                continue
 
-                total_duration += duration
-                segments.append({
-                    'from': self.G.nodes[path[i]]['name'],
-                    'to': self.G.nodes[path[i+1]]['name'],
-                    'departure': departure_time,
-                    'arrival': arrival_time,
-                    'duration': duration,
-                    'trip_id': trip_id
-                })
+            total_duration += edge_data['weight']
+            day_offset += edge_data.get('day_offset', 0)
+            if edge_data['kind'] != 'ride':
+                continue
+
+            segments.append({
+                'from': self.stations[edge_data['from_station']]['name'],
+                'to': self.stations[edge_data['to_station']]['name'],
+                'from_id': edge_data['from_station'],
+                'to_id': edge_data['to_station'],
+                'departure': edge_data['departure_time'] + day_offset * SECONDS_PER_DAY,
+                'arrival': edge_data['arrival_time'] + day_offset * SECONDS_PER_DAY,
+                'duration': edge_data['weight'],
+                'trip_index': edge_data['trip_index']
+            })
         return total_duration, segments
 
+    def _format_leg(self, leg, intermediate_stops):
+        stops = [
+            {
+                "name": self.stations[stop_id]['name'],
+                "id": stop_id,
+                "lat": self.stations[stop_id]['lat'],
+                "lon": self.stations[stop_id]['lon']
+            }
+            for stop_id in [leg['from_id']] + intermediate_stops + [leg['to_id']]
+        ]
+        return {
+            "stops": stops,
+            "departure": self._format_time(leg['departure']),
+            "arrival": self._format_time(leg['arrival']),
+            "departure_day_offset": leg['departure'] // SECONDS_PER_DAY,
+            "arrival_day_offset": leg['arrival'] // SECONDS_PER_DAY,
+            "duration": self._format_duration(leg['arrival'] - leg['departure']),
+            "trip_id": self.trip_ids[leg['trip_index']],
+            **self.trip_metadata[leg['trip_index']]
+        }
+
     def format_path_info_in_json(self, start_name, end_name, path, segments, total_duration):
         route_info = {
             "from": start_name,
             "to": end_name,
             "total_duration_formatted": self._format_duration(total_duration),
-            "total_duration": (total_duration),
+            "total_duration": total_duration / 60,
             "segments": []
         }
 
-        current_trip_id = None
         current_segment = None
         intermediate_stops = []
 
         for segment in segments:
-            if current_trip_id != segment['trip_id']:
+            if current_segment is None or current_segment['trip_index'] != segment['trip_index']:
                 if current_segment:
-                    stops = [
-                        {
-                            "name": stop,
-                            "id": self.get_stop_id(stop),
-                            "lat": self.G.nodes[self.get_stop_id(stop)]['lat'],
-                            "lon": self.G.nodes[self.get_stop_id(stop)]['lon']
-                        } 
-                        for stop in [current_segment['from']] + intermediate_stops + [current_segment['to']]
-                    ]
-                    route_info["segments"].append({
-                        "stops": stops,
-                        "departure": str(current_segment['departure']).split(', ')[-1],
-                        "arrival": str(current_segment['arrival']).split(', ')[-1],
-                        "duration": self._format_duration(current_segment['duration']),
-                        "trip_id": current_segment['trip_id']
-                    })
-
-                current_trip_id = segment['trip_id']
+                    route_info["segments"].append(self._format_leg(current_segment, intermediate_stops))
                 current_segment = segment.copy()
                 intermediate_stops = []
             else:
-                intermediate_stops.append(segment['from'])
+                intermediate_stops.append(segment['from_id'])
                 current_segment['to'] = segment['to']
+                current_segment['to_id'] = segment['to_id']
                 current_segment['arrival'] = segment['arrival']
-                current_segment['duration'] += segment['duration']
 
         if current_segment:
-            stops = [
-                {
-                    "name": stop,
-                    "id": self.get_stop_id(stop),
-                    "lat": self.G.nodes[self.get_stop_id(stop)]['lat'],
-                    "lon": self.G.nodes[self.get_stop_id(stop)]['lon']
-                } 
-                for stop in [current_segment['from']] + intermediate_stops + [current_segment['to']]
-            ]
-            route_info["segments"].append({
-                "stops": stops,
-                "departure": str(current_segment['departure']).split(', ')[-1],
-                "arrival": str(current_segment['arrival']).split(', ')[-1],
-                "duration": self._format_duration(current_segment['duration']),
-                "trip_id": current_segment['trip_id']
-            })
+            route_info["segments"].append(self._format_leg(current_segment, intermediate_stops))
 
         return route_info
 
     def get_stop_id(self, stop_name):
-        for stop in self.stops:
-            if stop['stop_name'] == stop_name:
-                return stop['stop_id']
+        for station_id, station in self.stations.items():
+            if station['name'] == stop_name:
+                return station_id
         return None
 
     def find_closest_city(self, input_city, threshold=7):
@@ -191,46 +401,302 @@ class TrainRouteMapper:
                 
         return closest_city
 
-    def find_shorter_paths(self, start_name, end_name):
-        start_stations = self.find_stations(start_name)
-        end_stations = self.find_stations(end_name)
-        
-        if not start_stations:
-            closest_city = self.find_closest_city(start_name)
+    def _resolve_stations(self, name, timer=None):
+        with stage(timer, 'station_lookup'):
+            stations = self.find_stations(name)
+        if not stations:
+            with stage(timer, 'fuzzy_match'):
+                closest_city = self.find_closest_city(name)
             if closest_city:
-                start_stations = self.find_stations(closest_city)
-            if not start_stations:
-                return json.dumps({"error": f"No stations found similar to '{start_name}'"})
-                
+                with stage(timer, 'station_lookup'):
+                    stations = self.find_stations(closest_city)
+        return stations
+
+    def _node_station(self, node):
+        if node[0] in ('from', 'to'):
+            return node[1]
+        return self.trip_stations[node[1]][node[2]]
+
+    def _remaining_time_bounds(self, end_stations):
+        """Lower bound of the travel time from each station to the closest of end_stations (rides only)."""
+        bounds = {}
+        heap = [(0, station) for station in end_stations]
+        while heap:
+            bound, station = heapq.heappop(heap)
+            if station in bounds:
+                continue
+            bounds[station] = bound
+            for from_station, duration in self.min_ride_times.get(station, {}).items():
+                if from_station not in bounds:
+                    heapq.heappush(heap, (bound + duration, from_station))
+        return bounds
+
+    def _shortest_paths(self, sources, targets, budget):
+        """
+        Multi-source A* on the time-expanded graph: shortest path to each target from the
+        closest source, stopping once every target is settled. Targets not reached before
+        the budget runs out are missing from the result.
+
+        The remaining time bounds never overestimate and drop by at most the weight of an
+        edge, so the first time a target is settled its path is the shortest.
+        """
+        targets = {target for target in targets if target in self.G}
+        bounds = self._remaining_time_bounds({target[1] for target in targets})
+        distances = {
+            source: 0 for source in sources
+            if source in self.G and self._node_station(source) in bounds
+        }
+        previous = {}
+        settled = set()
+        paths = {}
+        counter = itertools.count()
+        heap = [(bounds[self._node_station(source)], next(counter), source) for source in distances]
+        heapq.heapify(heap)
+        while heap and len(paths) < len(targets):
+            _, _, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            distance = distances[node]
+            if not budget.settle():
+                break
+            settled.add(node)
+            if node in targets:
+                path = [node]
+                while path[-1] in previous:
+                    path.append(previous[path[-1]])
+                paths[node] = path[::-1]
+                # Journeys end at ('to', station), nothing leaves it
+                continue
+
+            for neighbor, edge_data in self.G.adj[node].items():
+                bound = bounds.get(self._node_station(neighbor))
+                if bound is None:
+                    # No ride leads from there to a target
+                    continue
+                new_distance = distance + edge_data['weight']
+                if neighbor not in distances or new_distance < distances[neighbor]:
+                    distances[neighbor] = new_distance
+                    previous[neighbor] = node
+                    heapq.heappush(heap, (new_distance + bound, next(counter), neighbor))
+        return paths
+
+    def find_shorter_paths(self, start_name, end_name, time_budget=None, node_budget=None, timer=None):
+        """
+        Shortest journey to every destination station, from whichever origin station
+        reaches it first, found by a single search.
+
+        time_budget (seconds) and node_budget (settled nodes) bound the whole request: once
+        either is exceeded the routes found so far are returned with "partial" set.
+        timer (metrics.StageTimer) gets the station lookup, fuzzy match, path search
+        and formatting times.
+        """
+        start_stations = self._resolve_stations(start_name, timer)
+        if not start_stations:
+            return json.dumps({"error": f"No stations found similar to '{start_name}'"})
+
+        end_stations = self._resolve_stations(end_name, timer)
         if not end_stations:
-            closest_city = self.find_closest_city(end_name)
-            if closest_city:
-                end_stations = self.find_stations(closest_city)
-            if not end_stations:
-                return json.dumps({"error": f"No stations found similar to '{end_name}'"})
+            return json.dumps({"error": f"No stations found similar to '{end_name}'"})
 
         trip_data = {
-            "start_stations": list(set(self.G.nodes[s]['name'] for s in start_stations)),
-            "end_stations": list(set(self.G.nodes[e]['name'] for e in end_stations)),
+            "start_stations": list(set(self.stations[s]['name'] for s in start_stations)),
+            "end_stations": list(set(self.stations[e]['name'] for e in end_stations)),
             "routes": []
         }
 
-        for start_id, end_id in itertools.product(start_stations, end_stations):
-            if start_id == end_id:
-                continue
-            try:
-                path = nx.dijkstra_path(self.G, start_id, end_id, weight='weight')
-            except nx.NetworkXNoPath:
-                continue
-                
-            total_duration, segments = self.get_path_info(path)
-            route_info = self.format_path_info_in_json(
-                self.G.nodes[start_id]['name'],
-                self.G.nodes[end_id]['name'],
-                path,
-                segments,
-                total_duration
+        budget = SearchBudget(time_budget, node_budget)
+        with stage(timer, 'path_search'):
+            paths = self._shortest_paths(
+                [('from', start_id) for start_id in start_stations],
+                [('to', end_id) for end_id in end_stations if end_id not in start_stations],
+                budget
             )
+
+        for end_id in end_stations:
+            path = paths.get(('to', end_id))
+            if path is None:
+                continue
+
+            with stage(timer, 'formatting'):
+                total_duration, segments = self.get_path_info(path)
+                route_info = self.format_path_info_in_json(
+                    self.stations[path[0][1]]['name'],
+                    self.stations[end_id]['name'],
+                    path,
+                    segments,
+                    total_duration
+                )
             trip_data["routes"].append(route_info)
-            
-        return json.dumps(trip_data, ensure_ascii=False, indent=2)
\ No newline at end of file
+
+        trip_data["partial"] = budget.exceeded
+        with stage(timer, 'formatting'):
+            return json.dumps(trip_data, ensure_ascii=False, indent=2)
+
+    def _profile_lookup(self, profiles, profile_keys, station, time):
+        """Return the profile entry with the earliest arrival boardable after arriving at station at time."""
+        best = None
+        for to_station, min_transfer_time in self.min_transfer_times.get(station, {}).items():
+            if min_transfer_time is None or to_station not in profiles:
+                continue
+            # profile_keys holds negated departures, so entries leaving at or after the transfer are [0, index]
+            index = bisect.bisect_right(profile_keys[to_station], -(time + min_transfer_time)) - 1
+            if index >= 0 and (best is None or profiles[to_station][index][1] < best[1]):
+                best = profiles[to_station][index]
+        return best
+
+    def _earliest_arrival(self, start_stations, end_stations, departure_time):
+        """Earliest arrival at end_stations leaving start_stations at departure_time or later (forward connection scan)."""
+        ready = {station: departure_time for station in start_stations}
+        boarded = set()
+        best = None
+        for index in range(bisect.bisect_left(self.connection_departures, departure_time), len(self.connections)):
+            departure, arrival, from_station, to_station, trip_index, _, day = self.connections[index]
+            if best is not None and departure >= best:
+                break
+            trip_key = (trip_index, day)
+            if trip_key not in boarded:
+                if from_station not in ready or ready[from_station] > departure:
+                    continue
+                boarded.add(trip_key)
+            if to_station in end_stations:
+                best = arrival if best is None else min(best, arrival)
+                continue
+            for next_station, min_transfer_time in self.min_transfer_times.get(to_station, {}).items():
+                if min_transfer_time is not None and arrival + min_transfer_time < ready.get(next_station, float('inf')):
+                    ready[next_station] = arrival + min_transfer_time
+        return best
+
+    def _profile_scan(self, end_stations, budget, until=None):
+        """
+        Reverse connection scan computing, for every station, the Pareto set of
+        (departure, arrival at end_stations) pairs over the service day and the next one,
+        using the connections departing before until (all of them by default).
+
+        Profile entries are (departure, arrival, enter_connection, exit_connection) and are
+        appended by decreasing departure, so each list is ordered latest departure first.
+        When the budget runs out the scan stops: entries already found stay exact, only
+        the earlier departures are missing.
+        """
+        end_stations = set(end_stations)
+        profiles = defaultdict(list)
+        profile_keys = defaultdict(list)
+        trip_arrivals = {}
+
+        last = bisect.bisect_left(self.connection_departures, until) if until is not None else len(self.connections)
+        for index in range(last - 1, -1, -1):
+            if not budget.settle():
+                break
+            departure, arrival, from_station, to_station, trip_index, _, day = self.connections[index]
+            trip_key = (trip_index, day)
+
+            best = None
+            if to_station in end_stations:
+                best = (arrival, index)
+            trip_best = trip_arrivals.get(trip_key)
+            if trip_best and (best is None or trip_best[0] < best[0]):
+                best = trip_best
+            transfer = self._profile_lookup(profiles, profile_keys, to_station, arrival)
+            if transfer and (best is None or transfer[1] < best[0]):
+                best = (transfer[1], index)
+            if best is None:
+                continue
+
+            if trip_best is None or best[0] < trip_best[0]:
+                trip_arrivals[trip_key] = best
+
+            profile = profiles[from_station]
+            if profile and best[0] >= profile[-1][1]:
+                continue
+            if profile and profile[-1][0] == departure:
+                profile.pop()
+                profile_keys[from_station].pop()
+            profile.append((departure, best[0], index, best[1]))
+            profile_keys[from_station].append(-departure)
+
+        return profiles, profile_keys
+
+    def _profile_journey(self, profiles, profile_keys, end_stations, entry):
+        legs = []
+        while entry is not None:
+            _, arrival, enter_index, exit_index = entry
+            departure_time, _, from_station, _, trip_index, start, _ = self.connections[enter_index]
+            _, arrival_time, _, to_station, _, end, _ = self.connections[exit_index]
+            stops = self.trips[trip_index][start + 1:end + 1]
+            legs.append(self._format_leg({
+                'from_id': from_station,
+                'to_id': to_station,
+                'departure': departure_time,
+                'arrival': arrival_time,
+                'trip_index': trip_index
+            }, [self._get_station(stop['stop_id']) for stop in stops]))
+
+            if to_station in end_stations and arrival_time == arrival:
+                break
+            entry = self._profile_lookup(profiles, profile_keys, to_station, arrival_time)
+        return legs
+
+    def find_profile(self, start_name, end_name, time_budget=None, node_budget=None):
+        """
+        All Pareto-optimal (departure, arrival) journeys of the day, from a single reverse scan.
+
+        node_budget counts scanned connections; see find_shorter_paths for the budgets.
+        """
+        start_stations = self._resolve_stations(start_name)
+        if not start_stations:
+            return json.dumps({"error": f"No stations found similar to '{start_name}'"})
+
+        end_stations = self._resolve_stations(end_name)
+        if not end_stations:
+            return json.dumps({"error": f"No stations found similar to '{end_name}'"})
+
+        # A first-day journey arriving after the earliest arrival of those leaving at the
+        # last first-day departure or later is beaten by it: the scan can skip everything
+        # departing from then on, which is most of the next day, and reaches the
+        # first-day departures before the budget runs out
+        origins = [station for station in start_stations if station not in end_stations]
+        last_departure = max((self.last_departures[s] for s in origins if s in self.last_departures), default=None)
+        until = None
+        if last_departure is not None:
+            until = self._earliest_arrival(origins, set(end_stations), last_departure)
+
+        budget = SearchBudget(time_budget, node_budget)
+        profiles, profile_keys = self._profile_scan(end_stations, budget, until)
+
+        # Merge the origin stations and keep the entries no later departure beats, as
+        # _profile_scan does for each station: next-day departures take part, so a journey
+        # boarding today is dropped when a train tomorrow arrives earlier. Only the
+        # journeys boarding on the first day are listed.
+        entries = sorted(
+            ((entry, station) for station in start_stations if station not in end_stations
+             for entry in profiles.get(station, [])),
+            key=lambda x: (-x[0][0], x[0][1])
+        )
+        pareto = []
+        best_arrival = None
+        for entry, station in entries:
+            if best_arrival is None or entry[1] < best_arrival:
+                best_arrival = entry[1]
+                if self.connections[entry[2]][6] == 0:
+                    pareto.append((entry, station))
+
+        timetable = {
+            "start_stations": list(set(self.stations[s]['name'] for s in start_stations)),
+            "end_stations": list(set(self.stations[e]['name'] for e in end_stations)),
+            "journeys": [],
+            "partial": budget.exceeded
+        }
+        for entry, station in reversed(pareto):
+            segments = self._profile_journey(profiles, profile_keys, end_stations, entry)
+            total_duration = entry[1] - entry[0]
+            timetable["journeys"].append({
+                "from": self.stations[station]['name'],
+                "to": segments[-1]["stops"][-1]["name"],
+                "departure": segments[0]["departure"],
+                "arrival": segments[-1]["arrival"],
+                "arrival_day_offset": segments[-1]["arrival_day_offset"],
+                "total_duration_formatted": self._format_duration(total_duration),
+                "total_duration": total_duration / 60,
+                "segments": segments
+            })
+
+        return json.dumps(timetable, ensure_ascii=False, indent=2)
@@ -0,0 +1,54 @@
+"""
+Check that the journeys found on the time-expanded graph respect the minimum transfer
+times: every change of train must leave at least min_transfer_times[arrival station]
+[departure station] seconds after the arrival.
+
+Usage (from back/): python -m pathfinder.check_transfers [number of station pairs]
+"""
+import os
+import random
+import sys
+from pathfinder.TrainRouteMapper import TrainRouteMapper, SearchBudget
+
+GTFS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tgv')
+
+def transfer_violations(mapper, segments):
+    """(from station, to station, arrival, departure, minimum) of every change shorter than allowed"""
+    violations = []
+    for previous, segment in zip(segments, segments[1:]):
+        if previous['trip_index'] == segment['trip_index']:
+            continue
+        min_transfer_time = mapper.min_transfer_times.get(previous['to_id'], {}).get(segment['from_id'])
+        if min_transfer_time is None or segment['departure'] - previous['arrival'] < min_transfer_time:
+            violations.append((previous['to'], segment['from'], previous['arrival'], segment['departure'], min_transfer_time))
+    return violations
+
+def main(pair_count):
+    mapper = TrainRouteMapper(*(
+        os.path.join(GTFS_DIR, name)
+        for name in ('stops.txt', 'stop_times.txt', 'transfers.txt', 'trips.txt', 'routes.txt')
+    ))
+    stations = sorted(mapper.stations)
+    rng = random.Random(42)
+
+    journeys = changes = 0
+    violations = []
+    for _ in range(pair_count):
+        start_id, end_id = rng.sample(stations, 2)
+        path = mapper._shortest_paths([('from', start_id)], [('to', end_id)], SearchBudget()).get(('to', end_id))
+        if path is None:
+            continue
+        _, segments = mapper.get_path_info(path)
+        journeys += 1
+        changes += sum(1 for a, b in zip(segments, segments[1:]) if a['trip_index'] != b['trip_index'])
+        violations.extend(transfer_violations(mapper, segments))
+
+    print(f"Checked {journeys} journeys with {changes} changes of train")
+    for from_station, to_station, arrival, departure, min_transfer_time in violations:
+        print(f"  {from_station} -> {to_station}: arrives {mapper._format_time(arrival)}, "
+              f"leaves {mapper._format_time(departure)}, minimum {min_transfer_time}s")
+    print(f"{len(violations)} changes shorter than the minimum transfer time")
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+
+def cache_key(key):
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class SqliteQueryCache:
+    """
+    /process_query responses stored in a SQLite file, shared by every worker process
+    of the host. Entries expire after ttl seconds and the oldest ones are dropped
+    beyond max_size entries.
+    """
+    def __init__(self, path, ttl, max_size):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        # WAL lets the workers read while one of them writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS query_cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS query_cache_created_at ON query_cache (created_at)')
+        connection.commit()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM query_cache WHERE key = ? AND created_at > ?',
+            (cache_key(key), time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO query_cache (key, value, created_at) VALUES (?, ?, ?)',
+                (cache_key(key), json.dumps(value), now)
+            )
+            connection.execute('DELETE FROM query_cache WHERE created_at <= ?', (now - self.ttl,))
+            connection.execute(
+                'DELETE FROM query_cache WHERE key IN (SELECT key FROM query_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            )
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM query_cache')
+
+class RedisQueryCache:
+    """
+    /process_query responses stored in Redis, shared by every back instance. Redis
+    expires the entries, and its maxmemory policy bounds their number.
+    """
+    def __init__(self, url, ttl, prefix='query_cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + cache_key(key))
+        return json.loads(value) if value is not None else None
+
+    def put(self, key, value):
+        self.client.set(self.prefix + cache_key(key), json.dumps(value), ex=max(1, int(self.ttl)))
+
+    def clear(self):
+        for redis_key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(redis_key)
+
+def create_query_cache():
+    """Cache selected by QUERY_CACHE_BACKEND, None when disabled"""
+    backend = Config.QUERY_CACHE_BACKEND
+    if backend == 'sqlite':
+        return SqliteQueryCache(Config.QUERY_CACHE_PATH, Config.QUERY_CACHE_TTL, Config.QUERY_CACHE_MAX_SIZE)
+    if backend == 'redis':
+        return RedisQueryCache(Config.QUERY_CACHE_REDIS_URL, Config.QUERY_CACHE_TTL)
+    if backend == 'none':
+        return None
+    raise ValueError(f"Unknown query cache backend '{backend}'")
@@ -6,6 +6,7 @@ def register_routes(app):
     from routes.auth import auth_bp
     from routes.users import users_bp
     from .whisper import whisper_bp
+    from routes.metrics import metrics_bp
 
     app.register_blueprint(sentences_bp)
     app.register_blueprint(ml_models_bp)
@@ -13,4 +14,5 @@ def register_routes(app):
     app.register_blueprint(cities_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
-    app.register_blueprint(whisper_bp)
\ No newline at end of file
+    app.register_blueprint(whisper_bp)
+    app.register_blueprint(metrics_bp)
\ No newline at end of file
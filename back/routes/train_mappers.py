@@ -3,8 +3,9 @@ from controllers.train_mapper_controller import TrainMapperController
 
 train_mappers_bp = Blueprint('train_mappers', __name__)
 
-# Existing routes
-@train_mappers_bp.route('/process_query', methods=['POST'])
-def get_routes():
+# /process_query is served by the ASGI app (asgi.py)
+
+@train_mappers_bp.route('/timetable', methods=['GET'])
+def get_timetable():
     controller = TrainMapperController()
-    return controller.process_query()
\ No newline at end of file
+    return controller.get_timetable()
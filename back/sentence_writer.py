@@ -0,0 +1,106 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, Sentence
+from metrics import SENTENCE_WRITE_DURATION
+
+class SentenceWriteBuffer:
+    """
+    Write-behind buffer for the sentences recorded by /process_query.
+
+    add() only queues the text: a background thread inserts the queued sentences with
+    one multi-row INSERT every flush_interval seconds (or batch_size sentences), so a
+    slow or unavailable database never delays a query. When more than max_size
+    sentences are waiting the new ones are dropped. The queue is flushed on shutdown.
+    """
+    def __init__(self, app, max_size=10000, batch_size=100, flush_interval=1.0, max_attempts=3):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue(maxsize=max_size)
+        self.stopping = threading.Event()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+
+    def _start(self):
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+                atexit.register(self.stop)
+
+    def add(self, text):
+        if self.worker is None:
+            self._start()
+        try:
+            self.queue.put_nowait({
+                "text": text,
+                "is_valid": False,
+                "is_treated": False,
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            })
+        except queue.Full:
+            self.dropped += 1
+            print(f"Sentence write queue full, dropped sentence ({self.dropped} so far)")
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or (self.stopping.is_set() and self.queue.empty()):
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        with self.app.app_context(), SENTENCE_WRITE_DURATION.time():
+            try:
+                db.session.execute(insert(Sentence).values(rows))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        pending = []
+        attempts = 0
+        while not (self.stopping.is_set() and self.queue.empty() and not pending):
+            if not pending:
+                pending = self._next_batch()
+                attempts = 0
+                if not pending:
+                    continue
+            try:
+                self._write(pending)
+                self.written += len(pending)
+                pending = []
+            except Exception as e:
+                attempts += 1
+                print(f"Error writing {len(pending)} sentences (attempt {attempts}): {str(e)}")
+                if attempts >= self.max_attempts:
+                    self.dropped += len(pending)
+                    pending = []
+                elif not self.stopping.is_set():
+                    time.sleep(self.flush_interval * 2 ** attempts)
+
+    def stop(self, timeout=10):
+        """Writes the queued sentences and stops the worker"""
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
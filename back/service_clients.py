@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+
+class ServiceClient:
+    """
+    Keep-alive HTTP client for one internal service.
+
+    Connections are pooled (at most pool_size per service, callers wait for a free one
+    instead of opening more) and failed connections or retry_statuses answers are
+    retried with exponential backoff. Read timeouts are not retried.
+    """
+    def __init__(self, base_url, pool_size, timeout=None, retries=2, backoff=0.2, retry_statuses=(502, 503, 504)):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            # A read timeout means the service is slow, not down: retrying would only
+            # hold the query longer and add load to the busy model
+            read=0,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=retry_statuses,
+            # Service endpoints are idempotent, POST predictions included
+            allowed_methods=None,
+            # Hand the last answer back so callers keep using raise_for_status
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, f"{self.base_url}{path}", **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+class AsyncServiceClient:
+    """
+    asyncio counterpart of ServiceClient, used by the ASGI query pipeline.
+
+    It must be created and closed in the event loop that uses it.
+    """
+    def __init__(self, base_url, pool_size, timeout=None, retries=2, backoff=0.2, retry_statuses=(502, 503, 504)):
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_statuses = retry_statuses
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout),
+            # The transport retries failed connections, answers are retried below
+            transport=httpx.AsyncHTTPTransport(retries=retries, limits=limits)
+        )
+
+    async def request(self, method, path, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = await self.client.request(method, path, **kwargs)
+            if response.status_code not in self.retry_statuses or attempt == self.retries:
+                return response
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+def _service_settings(name):
+    retries = {'retries': Config.SERVICE_RETRIES, 'backoff': Config.SERVICE_RETRY_BACKOFF}
+    if name == 'ner':
+        return {'base_url': Config.NER_SERVICE_URL, 'pool_size': Config.NER_POOL_SIZE, 'timeout': 5, **retries}
+    if name == 'nlu':
+        return {'base_url': Config.NLU_SERVICE_URL, 'pool_size': Config.NLU_POOL_SIZE, 'timeout': 5, **retries}
+    if name == 'whisper':
+        # No timeout on transcriptions, and 503 only means the model is still loading
+        return {'base_url': Config.WHISPER_SERVICE_URL, 'pool_size': Config.WHISPER_POOL_SIZE, 'timeout': None,
+                'retry_statuses': (502, 504), **retries}
+    raise KeyError(f"Unknown service '{name}'")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_service_client(name):
+    """Client shared by every request thread of the back service"""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ServiceClient(**_service_settings(name))
+        return _clients[name]
+
+def create_async_service_client(name):
+    return AsyncServiceClient(**_service_settings(name))
@@ -0,0 +1,26 @@
+import asyncio
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the coroutine,
+    the others wait for it and get the same result (or exception). Nothing is kept
+    once the call is done. Calls must come from one event loop.
+    """
+    def __init__(self):
+        self._calls = {}
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # The exception is handed to the waiters, it must not be reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, coroutine_fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(coroutine_fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # A disconnected client cancels its own wait, not the call shared with the others
+        return await asyncio.shield(task)
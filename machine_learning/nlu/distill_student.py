@@ -0,0 +1,247 @@
+"""
+Distill a trained CamemBERT NLU model into a smaller student.
+
+The student keeps the CamemBERT architecture with only STUDENT_LAYERS encoder
+layers, initialised from evenly spaced teacher layers, so the NLU service loads
+and serves it (torch or ONNX) like any other model. It learns the teacher's soft
+labels on the stored sentences plus synthetic variants (city swaps and word
+dropout), and the true labels where they are known.
+
+Usage: python distill_student.py <teacher_model_dir>
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import time
+import torch
+import torch.nn.functional as F
+from datasets import Dataset
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments, Trainer, DataCollatorWithPadding
+from train_and_test import (
+    API_BASE_URL, OUTPUT_DIR, MAX_LENGTH, compute_metrics, prepare_datasets,
+    calculate_nlu_metrics, create_nlu_model_record, export_onnx
+)
+
+STUDENT_LAYERS = int(os.getenv('STUDENT_LAYERS', '3'))
+TEMPERATURE = float(os.getenv('DISTILLATION_TEMPERATURE', '2.0'))
+# Weight of the soft teacher loss against the hard label loss
+ALPHA = float(os.getenv('DISTILLATION_ALPHA', '0.7'))
+SYNTHETIC_PER_SENTENCE = int(os.getenv('SYNTHETIC_PER_SENTENCE', '2'))
+
+# Labels of synthetic sentences are unknown, only the teacher loss applies to them
+NO_LABEL = -100
+
+CITIES = [
+    "paris", "marseille", "lyon", "toulouse", "nice", "nantes", "strasbourg", "montpellier",
+    "bordeaux", "lille", "rennes", "reims", "le havre", "saint-étienne", "toulon", "grenoble",
+    "dijon", "angers", "nîmes", "le mans", "brest", "tours", "amiens", "perpignan", "metz",
+    "besançon", "orléans", "mulhouse", "rouen", "caen", "nancy", "avignon", "poitiers",
+    "la rochelle", "annecy", "biarritz", "saint-malo", "quimper", "valence", "colmar",
+]
+CITY_PATTERN = re.compile(r"(?<![\w-])(" + "|".join(re.escape(city) for city in CITIES) + r")(?![\w-])")
+
+def synthesize_sentences(sentences, per_sentence, seed=42):
+    """Variants of the stored sentences: other cities, or one word dropped"""
+    rng = random.Random(seed)
+    synthetic = []
+    for sentence in sentences:
+        for _ in range(per_sentence):
+            if CITY_PATTERN.search(sentence.lower()) and rng.random() < 0.5:
+                variant = CITY_PATTERN.sub(lambda _: rng.choice(CITIES), sentence.lower())
+            else:
+                words = sentence.split()
+                if len(words) < 4:
+                    continue
+                del words[rng.randrange(len(words))]
+                variant = " ".join(words)
+            synthetic.append(variant)
+    return list(set(synthetic) - set(sentences))
+
+def create_student(teacher, num_layers):
+    config = teacher.config.__class__.from_dict(teacher.config.to_dict())
+    config.num_hidden_layers = num_layers
+    student = AutoModelForSequenceClassification.from_config(config)
+
+    # Embeddings, classifier and evenly spaced encoder layers come from the teacher
+    teacher_state = teacher.state_dict()
+    step = teacher.config.num_hidden_layers / num_layers
+    layer_map = {student_layer: int(student_layer * step) for student_layer in range(num_layers)}
+    student_state = {}
+    for key in student.state_dict():
+        match = re.search(r"\.layer\.(\d+)\.", key)
+        if match:
+            student_layer = int(match.group(1))
+            teacher_key = key.replace(f".layer.{student_layer}.", f".layer.{layer_map[student_layer]}.", 1)
+        else:
+            teacher_key = key
+        student_state[key] = teacher_state[teacher_key]
+    student.load_state_dict(student_state)
+    return student
+
+def teacher_logits(teacher, tokenizer, texts, batch_size=32):
+    logits = []
+    teacher.eval()
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt"
+            ).to(teacher.device)
+            logits.extend(teacher(**inputs).logits.cpu().tolist())
+    return logits
+
+def measure_latency(model, tokenizer, texts, runs=200):
+    """Mean single-sentence CPU latency in milliseconds, as served by the NLU service"""
+    model = model.cpu().eval()
+    latencies = []
+    with torch.no_grad():
+        for i in range(runs + 10):
+            inputs = tokenizer(texts[i % len(texts)], truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+            start = time.perf_counter()
+            model(**inputs)
+            # The first calls only warm up
+            if i >= 10:
+                latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(latencies)
+
+class DistillationTrainer(Trainer):
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        labels = inputs.pop("labels")
+        soft_targets = inputs.pop("teacher_logits", None)
+        outputs = model(**inputs)
+        logits = outputs.logits
+
+        has_label = labels != NO_LABEL
+        hard_loss = F.cross_entropy(logits[has_label], labels[has_label]) if has_label.any() else logits.sum() * 0
+        if soft_targets is None:
+            # Evaluation batches only carry true labels
+            loss = hard_loss
+        else:
+            soft_loss = F.kl_div(
+                F.log_softmax(logits / TEMPERATURE, dim=-1),
+                F.softmax(soft_targets / TEMPERATURE, dim=-1),
+                reduction="batchmean"
+            ) * TEMPERATURE ** 2
+            loss = ALPHA * soft_loss + (1 - ALPHA) * hard_loss
+
+        return (loss, outputs) if return_outputs else loss
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("teacher_dir", help="NLU model directory written by train_and_test.py")
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    print("Preparing datasets...")
+    train_dataset, test_dataset = prepare_datasets(API_BASE_URL)
+    synthetic_texts = synthesize_sentences(list(train_dataset["text"]), SYNTHETIC_PER_SENTENCE)
+    print(f"Train dataset size: {len(train_dataset)} (+{len(synthetic_texts)} synthetic)")
+    print(f"Test dataset size: {len(test_dataset)}")
+
+    print("Loading teacher...")
+    tokenizer = AutoTokenizer.from_pretrained(args.teacher_dir)
+    teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher_dir)
+    if torch.cuda.is_available():
+        teacher = teacher.cuda()
+
+    print("Labelling sentences with the teacher...")
+    texts = list(train_dataset["text"]) + synthetic_texts
+    distillation_dataset = Dataset.from_dict({
+        "text": texts,
+        "label": list(train_dataset["label"]) + [NO_LABEL] * len(synthetic_texts),
+        "teacher_logits": teacher_logits(teacher, tokenizer, texts)
+    })
+
+    student = create_student(teacher, STUDENT_LAYERS)
+    print(f"Student: {STUDENT_LAYERS} layers, {student.num_parameters() / 1e6:.0f}M parameters "
+          f"(teacher {teacher.num_parameters() / 1e6:.0f}M)")
+
+    def tokenize_function(examples):
+        return tokenizer(examples["text"], truncation=True, max_length=MAX_LENGTH)
+
+    tokenized_train_dataset = distillation_dataset.map(tokenize_function, batched=True, remove_columns=["text"])
+    tokenized_test_dataset = test_dataset.map(tokenize_function, batched=True, remove_columns=["text"])
+
+    training_args = TrainingArguments(
+        output_dir="./results_student",
+        num_train_epochs=5,
+        per_device_train_batch_size=32,
+        per_device_eval_batch_size=32,
+        learning_rate=5e-5,
+        warmup_ratio=0.1,
+        weight_decay=0.01,
+        logging_dir="./logs_student",
+        evaluation_strategy="epoch",
+        save_strategy="epoch",
+        load_best_model_at_end=True,
+        # teacher_logits is not a model input but is needed by compute_loss
+        remove_unused_columns=False,
+    )
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        train_dataset=tokenized_train_dataset,
+        eval_dataset=tokenized_test_dataset,
+        compute_metrics=compute_metrics,
+        data_collator=DataCollatorWithPadding(tokenizer),
+    )
+
+    print("Starting distillation...")
+    trainer.train()
+
+    print("Calculating metrics...")
+    metrics = calculate_nlu_metrics(trainer, tokenized_test_dataset)
+    training_time = time.time() - start_time
+
+    print("Measuring latency...")
+    metrics["latency"] = {
+        "student_ms": measure_latency(student, tokenizer, test_dataset["text"]),
+        "teacher_ms": measure_latency(teacher, tokenizer, test_dataset["text"]),
+        "student_layers": STUDENT_LAYERS,
+        "student_parameters": student.num_parameters(),
+        "teacher_parameters": teacher.num_parameters(),
+    }
+    print(f"Latency: {metrics['latency']['student_ms']:.2f} ms (teacher {metrics['latency']['teacher_ms']:.2f} ms)")
+
+    training_info = {
+        "train_count": len(distillation_dataset),
+        "test_count": len(test_dataset),
+        "training_time": training_time,
+        "num_epochs": training_args.num_train_epochs,
+        "batch_size": training_args.per_device_train_batch_size,
+        "learning_rate": training_args.learning_rate
+    }
+
+    print("Storing model record...")
+    model_record = create_nlu_model_record(
+        metrics,
+        training_info,
+        name_prefix="NLU_Student",
+        description=f"French NLU model for travel intent classification, {STUDENT_LAYERS}-layer student distilled from {os.path.basename(os.path.normpath(args.teacher_dir))}",
+        base_model=os.path.basename(os.path.normpath(args.teacher_dir))
+    )
+    if not isinstance(model_record, dict):
+        print("\nWarning: Distillation completed but failed to create model record!")
+        return
+
+    model_dir = os.path.join(OUTPUT_DIR, model_record.get('name'))
+    print("Saving model...")
+    os.makedirs(model_dir, exist_ok=True)
+    student.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+    print("Exporting ONNX graph...")
+    try:
+        export_onnx(student, tokenizer, model_dir)
+    except Exception as e:
+        print(f"Error exporting ONNX graph: {str(e)}")
+
+    print("\nDistillation completed successfully!")
+    print(f"Model saved to disk at: {model_dir}")
+    print(f"Model record created with ID: {model_record.get('id')}")
+
+if __name__ == "__main__":
+    main()
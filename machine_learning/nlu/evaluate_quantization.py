@@ -0,0 +1,79 @@
+"""
+Compare a fine-tuned NLU model in fp32 and with int8 dynamic quantization.
+
+Accuracy is measured on the held-out split used by train_and_test.py, latency on
+single-sentence forward passes as served by the NLU service.
+
+Usage: python evaluate_quantization.py <model_dir> [--runs 200]
+"""
+import argparse
+import io
+import statistics
+import time
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from train_and_test import API_BASE_URL, MAX_LENGTH, prepare_datasets
+
+def quantize(model):
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def model_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / (1024 * 1024)
+
+def predict(model, tokenizer, texts, batch_size=32):
+    predictions = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt"
+            )
+            predictions.extend(model(**inputs).logits.argmax(dim=-1).tolist())
+    return np.array(predictions)
+
+def measure_latency(model, tokenizer, texts, runs):
+    # Warm up before timing
+    predict(model, tokenizer, texts[:8], batch_size=1)
+
+    latencies = []
+    with torch.no_grad():
+        for i in range(runs):
+            inputs = tokenizer(texts[i % len(texts)], truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+            start = time.perf_counter()
+            model(**inputs)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_dir", help="directory written by train_and_test.py")
+    parser.add_argument("--runs", type=int, default=200, help="timed single-sentence calls per model")
+    args = parser.parse_args()
+
+    print("Preparing held-out sentences...")
+    _, test_dataset = prepare_datasets(API_BASE_URL)
+    texts = test_dataset["text"]
+    labels = np.array(test_dataset["label"])
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_dir)
+    fp32_model = AutoModelForSequenceClassification.from_pretrained(args.model_dir).eval()
+    int8_model = quantize(AutoModelForSequenceClassification.from_pretrained(args.model_dir).eval())
+
+    # Same thread count as the serving container for comparable latencies
+    print(f"Evaluating on {len(texts)} sentences with {torch.get_num_threads()} threads")
+    predictions = {}
+    print(f"{'model':<6} {'accuracy':>9} {'size (MB)':>10} {'mean (ms)':>10} {'p95 (ms)':>9}")
+    for name, model in (("fp32", fp32_model), ("int8", int8_model)):
+        predictions[name] = predict(model, tokenizer, texts)
+        accuracy = float((predictions[name] == labels).mean())
+        mean_ms, p95_ms = measure_latency(model, tokenizer, texts, args.runs)
+        print(f"{name:<6} {accuracy:>9.4f} {model_size_mb(model):>10.1f} {mean_ms:>10.2f} {p95_ms:>9.2f}")
+
+    agreement = float((predictions["fp32"] == predictions["int8"]).mean())
+    print(f"\nint8 predictions matching fp32: {agreement:.2%}")
+
+if __name__ == "__main__":
+    main()
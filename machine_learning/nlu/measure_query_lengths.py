@@ -0,0 +1,41 @@
+"""
+Token length distribution of the stored sentences, used to choose NLU_MAX_LENGTH.
+
+The suggested value covers the chosen percentile rounded up to a multiple of 8,
+anything longer is truncated at training and serving time.
+
+Usage: python measure_query_lengths.py [--model camembert-base] [--percentile 99]
+"""
+import argparse
+import math
+import numpy as np
+from transformers import AutoTokenizer
+from train_and_test import API_BASE_URL, fetch_all_sentences
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="camembert-base", help="tokenizer name or saved model directory")
+    parser.add_argument("--percentile", type=float, default=99, help="share of sentences that must fit")
+    args = parser.parse_args()
+
+    sentences = fetch_all_sentences(API_BASE_URL, is_trip=True) + fetch_all_sentences(API_BASE_URL, is_trip=False)
+    if not sentences:
+        print("No sentences found")
+        return
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    # Lengths include the special tokens added around each sentence
+    lengths = np.array([len(ids) for ids in tokenizer(sentences)["input_ids"]])
+
+    print(f"\n{len(sentences)} sentences, tokens per sentence:")
+    print(f"  mean {lengths.mean():.1f}, max {lengths.max()}")
+    for percentile in (50, 90, 95, 99):
+        print(f"  p{percentile} {np.percentile(lengths, percentile):.0f}")
+
+    covered = np.percentile(lengths, args.percentile)
+    suggested = int(math.ceil(covered / 8) * 8)
+    truncated = int((lengths > suggested).sum())
+    print(f"\nSuggested NLU_MAX_LENGTH: {suggested} ({truncated} sentences would be truncated)")
+
+if __name__ == "__main__":
+    main()
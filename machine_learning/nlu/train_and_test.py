@@ -1,9 +1,14 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments, Trainer
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments, Trainer, DataCollatorWithPadding
 from datasets import Dataset
 import requests
 from typing import List, Dict
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, cross_val_predict
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+import joblib
 import numpy as np
+import torch
 import evaluate
 from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
 from collections import Counter
@@ -13,6 +18,13 @@ import os
 
 API_BASE_URL = "http://back:5000"
 OUTPUT_DIR = os.getenv('MODEL_OUTPUT_DIR', './fine_tuned_models/')
+# Covers the p99 of the sentences from create_dataset.py (the generated trip templates
+# run to 81 words at p99, so 64 tokens cut at least 6% of them). Estimated from word
+# counts, CamemBERT's tokenizer was not at hand: confirm with measure_query_lengths.py.
+MAX_LENGTH = int(os.getenv('NLU_MAX_LENGTH', '128'))
+# The cascade classifier only answers above the confidence reaching this accuracy
+CASCADE_TARGET_ACCURACY = float(os.getenv('CASCADE_TARGET_ACCURACY', '0.99'))
+CASCADE_FILE = "cascade.joblib"
 
 def compute_metrics(eval_pred):
     metric = evaluate.load("accuracy")
@@ -20,8 +32,8 @@ def compute_metrics(eval_pred):
     predictions = np.argmax(logits, axis=-1)
     return metric.compute(predictions=predictions, references=labels)
 
-def fetch_all_sentences(api_base_url: str, is_trip: bool, per_page: int = 100) -> List[str]:
-    sentences = []
+def fetch_all_items(api_base_url: str, is_trip: bool, per_page: int = 100) -> List[Dict]:
+    all_items = []
     page = 1
     has_next = True
     
@@ -41,7 +53,7 @@ def fetch_all_sentences(api_base_url: str, is_trip: bool, per_page: int = 100) -
             
         data = response.json()
         items = data.get('items', [])
-        sentences.extend([item['text'] for item in items])
+        all_items.extend(items)
         
         pagination = data.get('pagination', {})
         has_next = pagination.get('has_next', False)
@@ -49,7 +61,10 @@ def fetch_all_sentences(api_base_url: str, is_trip: bool, per_page: int = 100) -
         
         print(f"Fetched page {page-1} ({len(items)} sentences)")
     
-    return sentences
+    return all_items
+
+def fetch_all_sentences(api_base_url: str, is_trip: bool, per_page: int = 100) -> List[str]:
+    return [item['text'] for item in fetch_all_items(api_base_url, is_trip, per_page)]
 
 def prepare_datasets(api_base_url: str, test_size: float = 0.2) -> tuple[Dataset, Dataset]:
     print("Fetching trip-related sentences...")
@@ -77,7 +92,10 @@ def calculate_nlu_metrics(trainer, test_dataset):
     predictions = trainer.predict(test_dataset)
     y_true = test_dataset["label"]
     y_pred = np.argmax(predictions.predictions, axis=1)
-    
+    return calculate_classification_metrics(y_true, y_pred)
+
+def calculate_classification_metrics(y_true, y_pred):
+    """Per-class metrics and confusion matrix of travel (0) / non-travel (1) predictions"""
     try:
         precision, recall, f1, support = precision_recall_fscore_support(
             y_true, y_pred,
@@ -120,14 +138,20 @@ def calculate_nlu_metrics(trainer, test_dataset):
             "confusion_matrix": [[0, 0], [0, 0]]
         }
 
-def create_nlu_model_record(metrics_data: Dict, training_info: Dict):
-    model_name = f"NLU_Model_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M')}"
+def create_nlu_model_record(
+    metrics_data: Dict,
+    training_info: Dict,
+    name_prefix: str = "NLU_Model",
+    description: str = "French NLU model for travel intent classification",
+    base_model: str = "camembert-base"
+):
+    model_name = f"{name_prefix}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M')}"
     model_data = {
         "name": model_name,
         "type": "NLU",
         "version": "1.0",
-        "description": "French NLU model for travel intent classification",
-        "base_model": "camembert-base",
+        "description": description,
+        "base_model": base_model,
         "train_data_count": training_info["train_count"],
         "test_data_count": training_info["test_count"],
         "training_time": training_info["training_time"],
@@ -159,6 +183,73 @@ def create_nlu_model_record(metrics_data: Dict, training_info: Dict):
             print(f"Response content: {e.response.text}")
         return None, model_name
 
+def calibrate_threshold(probabilities, labels, target_accuracy: float) -> float:
+    """Lowest confidence above which predictions reach the target accuracy"""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    
+    order = np.argsort(-confidence)
+    accuracy_at_k = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    reached = np.nonzero(accuracy_at_k >= target_accuracy)[0]
+    if len(reached) == 0:
+        return 1.0
+    return float(confidence[order][reached[-1]])
+
+def train_cascade(train_dataset: Dataset, test_dataset: Dataset):
+    """TF-IDF + logistic regression answering the obvious sentences before CamemBERT"""
+    train_texts, train_labels = list(train_dataset["text"]), np.array(train_dataset["label"])
+    test_texts, test_labels = list(test_dataset["text"]), np.array(test_dataset["label"])
+    
+    def create_classifier():
+        return make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True, min_df=2),
+            LogisticRegression(max_iter=1000, C=10.0)
+        )
+    
+    # Out-of-fold probabilities so the threshold is not calibrated on memorized sentences
+    folds = min(5, int(np.bincount(train_labels).min()))
+    if folds < 2:
+        raise ValueError("Not enough sentences per class to calibrate the cascade")
+    probabilities = cross_val_predict(create_classifier(), train_texts, train_labels, cv=folds, method="predict_proba")
+    threshold = calibrate_threshold(probabilities, train_labels, CASCADE_TARGET_ACCURACY)
+    
+    classifier = create_classifier().fit(train_texts, train_labels)
+    test_probabilities = classifier.predict_proba(test_texts)
+    answered = test_probabilities.max(axis=1) >= threshold
+    correct = test_probabilities.argmax(axis=1) == test_labels
+    
+    metrics = {
+        "threshold": threshold,
+        "target_accuracy": CASCADE_TARGET_ACCURACY,
+        "test_coverage": float(answered.mean()),
+        "test_accuracy_answered": float(correct[answered].mean()) if answered.any() else None,
+        "test_accuracy_all": float(correct.mean())
+    }
+    return classifier, metrics
+
+def export_onnx(model, tokenizer, model_dir: str) -> str:
+    """Write model.onnx next to the saved model, for the onnxruntime backend of the NLU service"""
+    model = model.cpu().eval()
+    inputs = tokenizer(["je veux aller de paris à lyon"], return_tensors="pt")
+    onnx_path = os.path.join(model_dir, "model.onnx")
+    
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (inputs["input_ids"], inputs["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=14,
+            dynamo=False
+        )
+    return onnx_path
+
 def main():
     MODEL_NAME = "camembert-base"
     
@@ -176,7 +267,8 @@ def main():
     model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=2)
     
     def tokenize_function(examples):
-        return tokenizer(examples["text"], padding="max_length", truncation=True)
+        # No padding here: the collator pads each batch to its longest sentence
+        return tokenizer(examples["text"], truncation=True, max_length=MAX_LENGTH)
     
     print("Tokenizing datasets...")
     tokenized_train_dataset = train_dataset.map(tokenize_function, batched=True)
@@ -201,6 +293,7 @@ def main():
         train_dataset=tokenized_train_dataset,
         eval_dataset=tokenized_test_dataset,
         compute_metrics=compute_metrics,
+        data_collator=DataCollatorWithPadding(tokenizer),
     )
     
     print("Starting training...")
@@ -209,6 +302,15 @@ def main():
     print("Calculating metrics...")
     metrics = calculate_nlu_metrics(trainer, tokenized_test_dataset)
 
+    print("Training cascade classifier...")
+    try:
+        cascade, metrics["cascade"] = train_cascade(train_dataset, test_dataset)
+        print(f"Cascade answers {metrics['cascade']['test_coverage']:.1%} of test sentences "
+              f"above {metrics['cascade']['threshold']:.3f} confidence")
+    except Exception as e:
+        cascade = None
+        print(f"Error training cascade classifier: {str(e)}")
+
     training_time = time.time() - start_time
 
     training_info = {
@@ -228,6 +330,21 @@ def main():
     model.save_pretrained(os.path.join(OUTPUT_DIR, model_record.get('name')))
     tokenizer.save_pretrained(os.path.join(OUTPUT_DIR, model_record.get('name')))
     
+    if cascade is not None:
+        joblib.dump({
+            "classifier": cascade,
+            "threshold": metrics["cascade"]["threshold"],
+            "labels": [model.config.id2label[int(label)] for label in cascade.classes_]
+        }, os.path.join(OUTPUT_DIR, model_record.get('name'), CASCADE_FILE))
+    
+    print("Exporting ONNX graph...")
+    try:
+        onnx_path = export_onnx(model, tokenizer, os.path.join(OUTPUT_DIR, model_record.get('name')))
+        print(f"ONNX graph saved to: {onnx_path}")
+    except Exception as e:
+        # The PyTorch weights are enough for the torch backend of the NLU service
+        print(f"Error exporting ONNX graph: {str(e)}")
+    
     if model_record:
         print("\nTraining completed successfully!")
         print(f"Model saved to disk at: {os.path.join(OUTPUT_DIR, model_record.get('name'))}")
@@ -0,0 +1,200 @@
+"""
+Train a joint intent + entity model on the sentences table.
+
+One CamemBERT encoder feeds a travel/non-travel head and a DEPARTURE/ARRIVAL token
+head, so the NLU service answers both questions with one pass (/predict/joint)
+instead of chaining the NLU and NER services.
+
+Usage: python train_joint.py
+"""
+import os
+import time
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from sklearn.model_selection import train_test_split
+from transformers import AutoTokenizer, AutoModel, get_linear_schedule_with_warmup
+from joint_model import JointIntentEntityModel, ENTITY_LABELS, decode_entities
+from train_and_test import (
+    API_BASE_URL, OUTPUT_DIR, MAX_LENGTH, fetch_all_items,
+    calculate_classification_metrics, create_nlu_model_record
+)
+
+MODEL_NAME = "camembert-base"
+NUM_EPOCHS = int(os.getenv('JOINT_EPOCHS', '3'))
+BATCH_SIZE = int(os.getenv('JOINT_BATCH_SIZE', '16'))
+LEARNING_RATE = float(os.getenv('JOINT_LEARNING_RATE', '3e-5'))
+
+IGNORE_INDEX = -100
+
+def fetch_examples():
+    """(text, intent, entities) with intent 0 for travel sentences and 1 otherwise"""
+    examples = []
+    for is_trip, intent in ((True, 0), (False, 1)):
+        for item in fetch_all_items(API_BASE_URL, is_trip=is_trip):
+            entities = [
+                (entity['start'], entity['end'], entity['label'])
+                for entity in item.get('entities') or []
+                if isinstance(entity, dict) and entity.get('label') in ("DEPARTURE", "ARRIVAL")
+                and entity.get('start') is not None and entity.get('end') is not None
+            ]
+            examples.append((item['text'], intent, entities if is_trip else []))
+    return examples
+
+def align_entity_labels(offsets, entities):
+    """BIO label id of each token from the character spans of the entities"""
+    label_ids = []
+    for start, end in offsets:
+        if start == end:
+            label_ids.append(IGNORE_INDEX)
+            continue
+        label = "O"
+        for entity_start, entity_end, entity in entities:
+            if start < entity_end and end > entity_start:
+                label = ("I-" if start > entity_start else "B-") + entity
+                break
+        label_ids.append(ENTITY_LABELS.index(label))
+    return label_ids
+
+def create_collate_fn(tokenizer):
+    def collate(examples):
+        texts = [text for text, _, _ in examples]
+        inputs = tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_LENGTH,
+            return_offsets_mapping=True, return_tensors="pt"
+        )
+        offsets = inputs.pop("offset_mapping").tolist()
+        inputs["intent_labels"] = torch.tensor([intent for _, intent, _ in examples])
+        inputs["entity_labels"] = torch.tensor([
+            align_entity_labels(token_offsets, entities)
+            for token_offsets, (_, _, entities) in zip(offsets, examples)
+        ])
+        inputs["offsets"] = offsets
+        inputs["texts"] = texts
+        return inputs
+    return collate
+
+def compute_loss(model, batch, device):
+    intent_logits, entity_logits = model(batch["input_ids"].to(device), batch["attention_mask"].to(device))
+    intent_loss = F.cross_entropy(intent_logits, batch["intent_labels"].to(device))
+    entity_loss = F.cross_entropy(
+        entity_logits.view(-1, len(ENTITY_LABELS)),
+        batch["entity_labels"].to(device).view(-1),
+        ignore_index=IGNORE_INDEX
+    )
+    return intent_loss + entity_loss
+
+def calculate_entity_metrics(true_entities, predicted_entities):
+    """Exact-match precision/recall/F1 of the departure and arrival cities"""
+    metrics = {}
+    for key in ("departure", "arrival"):
+        predicted = sum(1 for entities in predicted_entities if entities[key])
+        support = sum(1 for entities in true_entities if entities[key])
+        correct = sum(
+            1 for true, pred in zip(true_entities, predicted_entities)
+            if true[key] and pred[key] and true[key].lower() == pred[key].lower()
+        )
+        precision = correct / predicted if predicted else 0.0
+        recall = correct / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        metrics[f"{key}_metrics"] = {"precision": precision, "recall": recall, "f1": f1, "support": support}
+    return metrics
+
+def evaluate(model, loader, device):
+    model.eval()
+    intent_true, intent_pred, true_entities, predicted_entities = [], [], [], []
+    with torch.no_grad():
+        for batch in loader:
+            intent_logits, entity_logits = model(batch["input_ids"].to(device), batch["attention_mask"].to(device))
+            intent_true.extend(batch["intent_labels"].tolist())
+            intent_pred.extend(intent_logits.argmax(dim=-1).tolist())
+
+            entity_ids = entity_logits.argmax(dim=-1).tolist()
+            true_ids = batch["entity_labels"].tolist()
+            for text, offsets, pred_ids, gold_ids in zip(batch["texts"], batch["offsets"], entity_ids, true_ids):
+                predicted_entities.append(decode_entities(text, offsets, pred_ids, ENTITY_LABELS))
+                gold_ids = [label_id if label_id != IGNORE_INDEX else 0 for label_id in gold_ids]
+                true_entities.append(decode_entities(text, offsets, gold_ids, ENTITY_LABELS))
+
+    metrics = calculate_classification_metrics(intent_true, intent_pred)
+    # Cities only matter for travel sentences
+    travel = [i for i, intent in enumerate(intent_true) if intent == 0]
+    metrics.update(calculate_entity_metrics(
+        [true_entities[i] for i in travel], [predicted_entities[i] for i in travel]
+    ))
+    return metrics
+
+def main():
+    start_time = time.time()
+
+    print("Preparing datasets...")
+    examples = fetch_examples()
+    train_examples, test_examples = train_test_split(
+        examples, test_size=0.2, random_state=42, stratify=[intent for _, intent, _ in examples]
+    )
+    print(f"Train dataset size: {len(train_examples)}")
+    print(f"Test dataset size: {len(test_examples)}")
+
+    print("Loading tokenizer and encoder...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = JointIntentEntityModel(AutoModel.from_pretrained(MODEL_NAME))
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+
+    collate = create_collate_fn(tokenizer)
+    train_loader = DataLoader(train_examples, batch_size=BATCH_SIZE, shuffle=True, collate_fn=collate)
+    test_loader = DataLoader(test_examples, batch_size=BATCH_SIZE, collate_fn=collate)
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE, weight_decay=0.01)
+    total_steps = NUM_EPOCHS * len(train_loader)
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(0.1 * total_steps), total_steps)
+
+    print("Starting training...")
+    for epoch in range(NUM_EPOCHS):
+        model.train()
+        epoch_loss = 0.0
+        for batch in train_loader:
+            loss = compute_loss(model, batch, device)
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            optimizer.zero_grad()
+            epoch_loss += loss.item()
+        print(f"Epoch {epoch + 1}/{NUM_EPOCHS}: loss {epoch_loss / len(train_loader):.4f}")
+
+    print("Calculating metrics...")
+    metrics = evaluate(model, test_loader, device)
+    print(f"Departure F1: {metrics['departure_metrics']['f1']:.3f}, Arrival F1: {metrics['arrival_metrics']['f1']:.3f}")
+
+    training_info = {
+        "train_count": len(train_examples),
+        "test_count": len(test_examples),
+        "training_time": time.time() - start_time,
+        "num_epochs": NUM_EPOCHS,
+        "batch_size": BATCH_SIZE,
+        "learning_rate": LEARNING_RATE
+    }
+
+    print("Storing model record...")
+    model_record = create_nlu_model_record(
+        metrics,
+        training_info,
+        name_prefix="Joint_Model",
+        description="French joint model for travel intent classification and DEPARTURE/ARRIVAL extraction"
+    )
+    if not isinstance(model_record, dict):
+        print("\nWarning: Training completed but failed to create model record!")
+        return
+
+    model_dir = os.path.join(OUTPUT_DIR, model_record.get('name'))
+    print("Saving model...")
+    os.makedirs(model_dir, exist_ok=True)
+    model.cpu().save(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+    print("\nTraining completed successfully!")
+    print(f"Model saved to disk at: {model_dir}")
+    print(f"Model record created with ID: {model_record.get('id')}")
+
+if __name__ == "__main__":
+    main()
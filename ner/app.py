@@ -1,52 +1,220 @@
-from flask import Flask, request, jsonify
-import spacy
-from spacy.language import Language
-from spacy_langdetect import LanguageDetector
+from flask import Flask, Response, g, request, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from collections import OrderedDict
+import gc
+import hashlib
 import os
+import threading
+import time
+from language_gate import get_language_gate
+from inference_profile import load_model, get_rss_mb
+from gazetteer import Gazetteer, load_cities
+from response_cache import ResponseCache
 
 app = Flask(__name__)
 
-def get_lang_detector(nlp, name):
-    return LanguageDetector()
+REQUEST_DURATION = Histogram(
+    'ner_request_duration_seconds',
+    'Time to answer a NER service request',
+    ['endpoint']
+)
+STAGE_DURATION = Histogram(
+    'ner_stage_duration_seconds',
+    'Time spent in each NER processing stage',
+    ['stage']
+)
 
-Language.factory("language_detector", func=get_lang_detector)
+# Batch endpoint limits
+DEFAULT_BATCH_SIZE = 64
+MAX_BATCH_TEXTS = 1000
+
+# Resident model limits: models load on first use and the least recently used one is
+# evicted past MAX_LOADED_MODELS or MAX_MEMORY_MB of RSS (0 disables the memory cap).
+# Pinned models (comma-separated names, e.g. the production model) are loaded at
+# startup and never evicted.
+MAX_LOADED_MODELS = int(os.getenv('NER_MAX_LOADED_MODELS', '2'))
+MAX_MEMORY_MB = int(os.getenv('NER_MAX_MEMORY_MB', '0'))
+PINNED_MODELS = [name.strip() for name in os.getenv('NER_PINNED_MODELS', '').split(',') if name.strip()]
+
+# Language check run on the raw text before the model: heuristic, langdetect or none.
+# Callers that already know the text is French can skip it per request.
+LANGUAGE_GATE = os.getenv('NER_LANGUAGE_GATE', 'heuristic')
+
+# Load models without the components process_text does not need (tagger, parser...)
+INFERENCE_ONLY = os.getenv('NER_INFERENCE_ONLY', 'true').lower() == 'true'
+
+# Answer template-like sentences ("de X à Y") from the city list, the model only
+# runs when the gazetteer cannot assign both roles unambiguously
+USE_GAZETTEER = os.getenv('NER_GAZETTEER', 'true').lower() == 'true'
+
+# Responses cached per (model, normalized text), 0 disables the cache
+CACHE_SIZE = int(os.getenv('NER_CACHE_SIZE', '10000'))
+
+def model_version(model_path):
+    """Short hash of the paths, sizes and mtimes of the model files, changes when they are replaced"""
+    digest = hashlib.sha256()
+    for directory, _, files in sorted(os.walk(model_path)):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
 
 class NERService:
     def __init__(self):
-        self.ner_models = {}
+        self.ner_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'ner_fine_tuned_models')
+        self.model_paths = {}
+        # Returned with the predictions, callers caching them key on it
+        self.model_versions = {}
+        # Resident models, least recently used first
+        self.ner_models = OrderedDict()
+        self.pinned_models = set(PINNED_MODELS)
+        # Guards the model lists, never held while a model loads
+        self.lock = threading.Lock()
+        # One lock per model name, so concurrent requests load a model once
+        self.load_locks = {}
+        self.language_gate = get_language_gate(LANGUAGE_GATE)
+        self.gazetteer = Gazetteer(load_cities()) if USE_GAZETTEER else None
+        self.cache = ResponseCache(CACHE_SIZE)
         self._initialize_models()
     
-    def _initialize_models(self):
-        # Load NER models from the specified directory
-        ner_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'ner_fine_tuned_models')
-        
-        for model_name in os.listdir(ner_dir):
-            model_path = os.path.join(ner_dir, model_name)
+    def _discover_models(self):
+        self.model_paths = {}
+        # A resident model keeps the version of the files it was loaded from
+        versions = {name: self.model_versions[name] for name in self.ner_models if name in self.model_versions}
+        for model_name in os.listdir(self.ner_dir):
+            model_path = os.path.join(self.ner_dir, model_name)
             if os.path.isdir(model_path):
-                nlp = spacy.load(model_path)
-                nlp.add_pipe('language_detector', last=True)
-                self.ner_models[model_name] = nlp
-    
-    def get_ner_model(self, model_name):
-        if model_name not in self.ner_models:
+                self.model_paths[model_name] = model_path
+                if model_name not in versions:
+                    versions[model_name] = model_version(model_path)
+        self.model_versions = versions
+
+    def _initialize_models(self):
+        # Only list the available models, they are loaded on first use
+        self._discover_models()
+        for model_name in self.pinned_models:
+            if model_name in self.model_paths:
+                self.get_ner_model(model_name)
+            else:
+                print(f"Pinned NER model '{model_name}' not found")
+
+    def _load_model(self, model_name, model_path):
+        nlp = load_model(model_path, INFERENCE_ONLY)
+        print(f"Loaded NER model '{model_name}' with pipeline {nlp.pipe_names}")
+        return nlp
+
+    def _over_budget(self):
+        if len(self.ner_models) > MAX_LOADED_MODELS:
+            return True
+        if MAX_MEMORY_MB:
+            rss = get_rss_mb()
+            return rss is not None and rss > MAX_MEMORY_MB
+        return False
+
+    def _evict_models(self, keep):
+        while self._over_budget():
+            candidate = next((name for name in self.ner_models if name != keep and name not in self.pinned_models), None)
+            if candidate is None:
+                break
+            del self.ner_models[candidate]
+            print(f"Evicted NER model '{candidate}'")
+            # Release the model memory before measuring RSS again
+            gc.collect()
+
+    def _check_model(self, model_name):
+        if model_name not in self.model_paths:
+            # The model may have been trained since startup
+            self._discover_models()
+        if model_name not in self.model_paths:
             raise KeyError(f"NER model '{model_name}' not found")
-        return self.ner_models[model_name]
 
-    def process_text(self, text, model_name):
+    def _resident_model(self, model_name):
+        # Called with self.lock held
+        nlp = self.ner_models.get(model_name)
+        if nlp is not None:
+            self.ner_models.move_to_end(model_name)
+        return nlp
+
+    def get_ner_model(self, model_name):
+        with self.lock:
+            nlp = self._resident_model(model_name)
+            if nlp is not None:
+                return nlp
+            self._check_model(model_name)
+            load_lock = self.load_locks.setdefault(model_name, threading.Lock())
+
+        # Requests for other models, cache and gazetteer hits go on while this one loads
+        with load_lock:
+            with self.lock:
+                # Loaded by another request while this one waited
+                nlp = self._resident_model(model_name)
+                if nlp is not None:
+                    return nlp
+                model_path = self.model_paths[model_name]
+
+            # The files may have changed since they were listed
+            version = model_version(model_path)
+            nlp = self._load_model(model_name, model_path)
+            with self.lock:
+                self.ner_models[model_name] = nlp
+                self.model_versions[model_name] = version
+                self._evict_models(keep=model_name)
+            return nlp
+
+    def reload_model(self, model_name):
+        # Pick up a retrained model without restarting the service
+        with self.lock:
+            self._discover_models()
+            self._check_model(model_name)
+            load_lock = self.load_locks.setdefault(model_name, threading.Lock())
+        # Wait for a load of the previous weights in progress, it would be kept otherwise
+        with load_lock:
+            with self.lock:
+                self.ner_models.pop(model_name, None)
+                self.cache.invalidate(model_name)
+        return self.get_ner_model(model_name)
+
+    def is_french(self, text):
+        # Normalized so the gate cache hits regardless of case and spacing
+        return self.language_gate(" ".join(text.lower().split()))
+
+    def _match_gazetteer(self, text):
+        if self.gazetteer is None:
+            return None
+        return self.gazetteer.extract(text)
+
+    def _extract_entities(self, doc):
+        return {
+            "departure": next((ent.text for ent in doc.ents if ent.label_ == 'DEPARTURE'), None),
+            "arrival": next((ent.text for ent in doc.ents if ent.label_ == 'ARRIVAL'), None)
+        }
+
+    def process_text(self, text, model_name, check_language=True):
         try:
-            nlp = self.get_ner_model(model_name)
-            doc = nlp(text)
-            
+            with self.lock:
+                self._check_model(model_name)
+
             # Check language
-            if doc._.language['language'] != 'fr':
-                return {"error": "Text is not in French"}, 400
-            
-            # Extract entities
-            entities = {
-                "departure": next((ent.text for ent in doc.ents if ent.label_ == 'DEPARTURE'), None),
-                "arrival": next((ent.text for ent in doc.ents if ent.label_ == 'ARRIVAL'), None)
-            }
-            
+            if check_language:
+                with STAGE_DURATION.labels('language_check').time():
+                    is_french = self.is_french(text)
+                if not is_french:
+                    return {"error": "Text is not in French"}, 400
+
+            entities = self.cache.get(model_name, text)
+            if entities is not None:
+                return entities, 200
+
+            with STAGE_DURATION.labels('gazetteer').time():
+                entities = self._match_gazetteer(text)
+            if entities is None:
+                with STAGE_DURATION.labels('model_load').time():
+                    nlp = self.get_ner_model(model_name)
+                with STAGE_DURATION.labels('inference').time():
+                    doc = nlp(text)
+                entities = self._extract_entities(doc)
+            self.cache.put(model_name, text, entities)
             return entities, 200
             
         except KeyError as e:
@@ -54,8 +222,60 @@ class NERService:
         except Exception as e:
             return {"error": f"Processing error: {str(e)}"}, 500
 
+    def process_texts(self, texts, model_name, batch_size=DEFAULT_BATCH_SIZE, check_language=True):
+        """Run a list of texts through nlp.pipe, returning one result (entities or error) per text."""
+        try:
+            with self.lock:
+                self._check_model(model_name)
+        except KeyError as e:
+            return {"error": str(e)}, 400
+
+        results = [None] * len(texts)
+        valid_indexes = []
+        for i, text in enumerate(texts):
+            if not isinstance(text, str) or not text.strip():
+                results[i] = {"error": "Text must be a non-empty string"}
+            elif check_language and not self.is_french(text):
+                results[i] = {"error": "Text is not in French"}
+            else:
+                results[i] = self.cache.get(model_name, text)
+                if results[i] is None:
+                    results[i] = self._match_gazetteer(text)
+                    if results[i] is None:
+                        valid_indexes.append(i)
+                    else:
+                        self.cache.put(model_name, text, results[i])
+
+        if not valid_indexes:
+            return {"results": results}, 200
+
+        try:
+            with STAGE_DURATION.labels('model_load').time():
+                nlp = self.get_ner_model(model_name)
+            with STAGE_DURATION.labels('inference').time():
+                docs = list(nlp.pipe((texts[i] for i in valid_indexes), batch_size=batch_size))
+            for i, doc in zip(valid_indexes, docs):
+                results[i] = self._extract_entities(doc)
+                self.cache.put(model_name, texts[i], results[i])
+        except Exception:
+            # A failing batch should not hide the texts that can be processed: retry them one by one
+            for i in valid_indexes:
+                results[i], _ = self.process_text(texts[i], model_name, check_language=False)
+
+        return {"results": results}, 200
+
 ner_service = NERService()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    if request.endpoint != 'metrics':
+        REQUEST_DURATION.labels(request.endpoint or 'not_found').observe(time.perf_counter() - g.request_start)
+    return response
+
 @app.route('/predict', methods=['POST'])
 def predict():
     data = request.json
@@ -64,12 +284,60 @@ def predict():
     
     text = data.get('text')
     model_name = data.get('model_name')
+    check_language = data.get('check_language', True)
     
     if not text or not model_name:
         return jsonify({"error": "Missing required parameters"}), 400
     
-    result, status_code = ner_service.process_text(text, model_name)
+    result, status_code = ner_service.process_text(text, model_name, check_language)
+    if status_code == 200:
+        result = {**result, "model_version": ner_service.model_versions.get(model_name)}
+    return jsonify(result), status_code
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    texts = data.get('texts')
+    model_name = data.get('model_name')
+    batch_size = data.get('batch_size', DEFAULT_BATCH_SIZE)
+    check_language = data.get('check_language', True)
+    
+    if not isinstance(texts, list) or not texts or not model_name:
+        return jsonify({"error": "Missing required parameters"}), 400
+    if len(texts) > MAX_BATCH_TEXTS:
+        return jsonify({"error": f"Too many texts, maximum is {MAX_BATCH_TEXTS}"}), 400
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return jsonify({"error": "batch_size must be a positive integer"}), 400
+    
+    result, status_code = ner_service.process_texts(texts, model_name, batch_size, check_language)
     return jsonify(result), status_code
 
+@app.route('/models/reload', methods=['POST'])
+def reload_model():
+    data = request.json
+    if not data or not data.get('model_name'):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        ner_service.reload_model(data['model_name'])
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"message": f"NER model '{data['model_name']}' reloaded"}), 200
+
+@app.route('/models/versions', methods=['GET'])
+def model_versions():
+    return jsonify(ner_service.model_versions), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(ner_service.cache.stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
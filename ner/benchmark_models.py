@@ -0,0 +1,88 @@
+"""
+Compare latency and memory of the full and inference-only pipelines of NER models.
+
+Each (model, profile) pair is measured in a fresh process so resident memory is not
+shared between runs.
+
+Usage: python benchmark_models.py [--runs 200] [model_name ...]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import time
+from inference_profile import load_model, get_rss_mb
+
+NER_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'ner_fine_tuned_models')
+
+SAMPLE_SENTENCES = [
+    "je veux aller de paris à lyon",
+    "je voudrais un billet pour marseille depuis bordeaux",
+    "comment me rendre à nice en partant de lille",
+    "trajet strasbourg rennes demain matin",
+    "je souhaite partir de toulouse pour rejoindre nantes",
+    "quel train pour aller à montpellier depuis dijon",
+]
+
+
+def measure(model_path, inference_only, runs, results):
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    nlp = load_model(model_path, inference_only)
+    load_time = time.perf_counter() - start
+    rss_after = get_rss_mb()
+
+    # Warm up caches before timing
+    for text in SAMPLE_SENTENCES:
+        nlp(text)
+
+    latencies = []
+    for i in range(runs):
+        text = SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)]
+        start = time.perf_counter()
+        nlp(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    results.put({
+        "pipeline": list(nlp.pipe_names),
+        "load_time": load_time,
+        "memory_mb": rss_after - rss_before if rss_before is not None else None,
+        "mean_ms": statistics.mean(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    })
+
+
+def run_isolated(model_path, inference_only, runs):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=measure, args=(model_path, inference_only, runs, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="*", help="model names, all models by default")
+    parser.add_argument("--runs", type=int, default=200, help="timed calls per model and profile")
+    args = parser.parse_args()
+
+    model_names = args.models or sorted(
+        name for name in os.listdir(NER_DIR) if os.path.isdir(os.path.join(NER_DIR, name))
+    )
+
+    print(f"{'model':<30} {'profile':<10} {'load (s)':>9} {'memory (MB)':>12} {'mean (ms)':>10} {'p95 (ms)':>9}")
+    for model_name in model_names:
+        model_path = os.path.join(NER_DIR, model_name)
+        for profile, inference_only in (("full", False), ("inference", True)):
+            result = run_isolated(model_path, inference_only, args.runs)
+            memory = f"{result['memory_mb']:.0f}" if result["memory_mb"] is not None else "n/a"
+            print(f"{model_name:<30} {profile:<10} {result['load_time']:>9.2f} {memory:>12} "
+                  f"{result['mean_ms']:>10.2f} {result['p95_ms']:>9.2f}")
+            print(f"{'':<30} pipeline: {', '.join(result['pipeline'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import unicodedata
+import spacy
+from spacy.matcher import PhraseMatcher
+from spacy.util import filter_spans
+
+# Rule-based first stage: known city names plus French directional cues.
+# It only answers when every city in the sentence gets an unambiguous role,
+# otherwise the statistical model is used.
+
+DEFAULT_CITIES_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', 'cities.txt')
+
+# Token sequences right before a city, longest first wins
+ARRIVAL_CUES = [
+    ("en", "direction", "de"), ("en", "direction", "d'"), ("direction", "de"), ("direction", "d'"),
+    ("destination", "de"), ("destination", "d'"), ("jusqu'", "à"), ("jusqu'", "a"),
+    ("à",), ("a",), ("au",), ("aux",), ("pour",), ("vers",), ("rejoindre",), ("direction",),
+]
+DEPARTURE_CUES = [
+    ("au", "départ", "de"), ("au", "départ", "d'"), ("en", "partant", "de"), ("en", "partant", "d'"),
+    ("départ", "de"), ("départ", "d'"), ("partant", "de"), ("partant", "d'"),
+    ("depuis",), ("de",), ("d'",), ("du",), ("des",), ("entre",),
+]
+# "de Lyon" after these words names a station or an area, not a departure
+AMBIGUOUS_BEFORE_CUE = {"gare", "aéroport", "aeroport", "région", "region", "périphérie"}
+
+DEPARTURE = "DEPARTURE"
+ARRIVAL = "ARRIVAL"
+
+
+def strip_accents(text):
+    return ''.join(char for char in unicodedata.normalize('NFD', text) if unicodedata.category(char) != 'Mn')
+
+
+def load_cities(cities_file=DEFAULT_CITIES_FILE):
+    with open(cities_file, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+class Gazetteer:
+    def __init__(self, cities):
+        self.nlp = spacy.blank('fr')
+        self.matcher = PhraseMatcher(self.nlp.vocab, attr='LOWER')
+        # Cues indexed by their last token, longest first
+        self.cues = {}
+        for cue, role in sorted(
+            [(cue, ARRIVAL) for cue in ARRIVAL_CUES] + [(cue, DEPARTURE) for cue in DEPARTURE_CUES],
+            key=lambda x: -len(x[0])
+        ):
+            self.cues.setdefault(cue[-1], []).append((cue, role))
+
+        for city in cities:
+            # Accent-less and space-separated spellings, plus "Mans" for "du Mans" / "au Mans"
+            forms = {city, city.replace('-', ' ')}
+            first_word, _, rest = city.partition(' ')
+            if first_word.lower() in ('le', 'les') and rest:
+                forms |= {rest, rest.replace('-', ' ')}
+            forms |= {strip_accents(form) for form in forms}
+            self.matcher.add(city, [self.nlp.make_doc(form.lower()) for form in forms])
+
+    def _cue_before(self, doc, start):
+        if start == 0:
+            return None, None, None
+        for cue, role in self.cues.get(doc[start - 1].lower_, []):
+            cue_start = start - len(cue)
+            if cue_start < 0:
+                continue
+            if tuple(token.lower_ for token in doc[cue_start:start]) == cue:
+                return cue, role, cue_start
+        return None, None, None
+
+    def extract(self, text):
+        """Return {"departure", "arrival"} when the sentence is unambiguous, None otherwise."""
+        doc = self.nlp.make_doc(text)
+        matches = {(start, end): match_id for match_id, start, end in self.matcher(doc)}
+        spans = filter_spans([doc[start:end] for start, end in matches])
+        if len(spans) != 2:
+            return None
+
+        roles = {}
+        previous_cue = None
+        for span in spans:
+            cue, role, cue_start = self._cue_before(doc, span.start)
+            if cue is None and previous_cue == ("entre",) and doc[span.start - 1].lower_ == "et":
+                role = ARRIVAL
+            if role is None or role in roles:
+                return None
+            if role == DEPARTURE and cue_start > 0 and doc[cue_start - 1].lower_ in AMBIGUOUS_BEFORE_CUE:
+                return None
+            # Canonical city name, so clients get "Le Mans" for "du mans"
+            roles[role] = self.nlp.vocab.strings[matches[(span.start, span.end)]]
+            previous_cue = cue
+
+        return {"departure": roles[DEPARTURE], "arrival": roles[ARRIVAL]}
@@ -0,0 +1,48 @@
+import os
+import spacy
+from spacy.util import load_config
+
+# Components that produce doc.ents, the only output the service reads
+ENTITY_COMPONENTS = {"ner", "entity_ruler", "span_ruler"}
+
+# Factories a component can listen to instead of embedding its own tok2vec
+SHARED_EMBEDDING_FACTORIES = {"tok2vec", "transformer", "curated_transformer"}
+
+
+def get_excluded_components(model_path):
+    """
+    Components of a saved pipeline that are not needed to compute entities.
+
+    fr_core_news_lg based models also carry tok2vec, morphologizer, parser,
+    attribute_ruler and lemmatizer. A shared tok2vec/transformer is only kept
+    when an entity component listens to it.
+    """
+    config = load_config(os.path.join(model_path, "config.cfg"))
+    components = config["components"]
+    pipeline = config["nlp"]["pipeline"]
+
+    keep = {name for name in pipeline if name in ENTITY_COMPONENTS or components[name].get("factory") in ENTITY_COMPONENTS}
+    listens = any(
+        "Listener" in components[name].get("model", {}).get("tok2vec", {}).get("@architectures", "")
+        for name in keep
+    )
+    if listens:
+        keep |= {name for name in pipeline if components[name].get("factory") in SHARED_EMBEDDING_FACTORIES}
+
+    return [name for name in pipeline if name not in keep]
+
+
+def get_rss_mb():
+    # Current resident set size, None where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def load_model(model_path, inference_only=True):
+    if inference_only:
+        return spacy.load(model_path, exclude=get_excluded_components(model_path))
+    return spacy.load(model_path)
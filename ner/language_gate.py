@@ -0,0 +1,87 @@
+import re
+from functools import lru_cache
+
+# Cheap replacements for running a probabilistic language detector on every doc.
+# A gate takes the raw text and returns True when it should be processed as French.
+
+WORD_PATTERN = re.compile(r"[a-zàâäçéèêëîïôöùûüÿœæ]+")
+FRENCH_DIACRITICS = set("àâçéèêëîïôùûüÿœæ")
+
+FRENCH_WORDS = {
+    "je", "tu", "il", "elle", "nous", "vous", "ils", "elles", "me", "moi", "on",
+    "le", "la", "les", "un", "une", "des", "du", "de", "au", "aux", "à",
+    "et", "ou", "en", "dans", "sur", "pour", "par", "avec", "sans", "vers", "depuis",
+    "est", "suis", "veux", "voudrais", "souhaite", "aimerais", "aller", "partir",
+    "rendre", "rejoindre", "comment", "quel", "quelle", "demain", "aujourd", "hui",
+    "train", "billet", "trajet", "gare", "ville", "ce", "cette", "mon", "ma", "mes",
+    "ne", "pas", "qui", "que", "quoi", "où", "faire", "puis", "entre",
+}
+
+OTHER_LANGUAGE_WORDS = {
+    "en": {
+        "the", "to", "from", "i", "want", "go", "going", "is", "of", "and", "please",
+        "how", "can", "get", "would", "like", "ticket", "travel", "what", "my", "me",
+    },
+    "es": {
+        "el", "los", "las", "quiero", "ir", "desde", "hasta", "para", "por", "una",
+        "como", "viajar", "billete", "mañana", "y", "es",
+    },
+    "de": {
+        "ich", "will", "nach", "von", "der", "die", "das", "und", "ist", "möchte",
+        "fahren", "zug", "wie", "komme", "mit",
+    },
+    "it": {
+        "voglio", "andare", "da", "il", "gli", "per", "che", "sono", "biglietto",
+        "come", "domani", "treno", "della",
+    },
+}
+
+
+@lru_cache(maxsize=4096)
+def french_heuristic_gate(text):
+    """
+    French stopword/diacritic heuristic.
+
+    Texts are only rejected when another language has more marker words than French,
+    so bare city lists such as "paris lyon" go through.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    french_score = sum(word in FRENCH_WORDS for word in words)
+    if any(char in FRENCH_DIACRITICS for char in text.lower()):
+        french_score += 1
+
+    other_score = max(
+        sum(word in language_words for word in words)
+        for language_words in OTHER_LANGUAGE_WORDS.values()
+    )
+    return other_score <= french_score
+
+
+@lru_cache(maxsize=4096)
+def langdetect_gate(text):
+    """Probabilistic detector, slower but closer to the former spacy_langdetect behaviour."""
+    from langdetect import detect, DetectorFactory
+    from langdetect.lang_detect_exception import LangDetectException
+
+    DetectorFactory.seed = 0
+    try:
+        return detect(text) == "fr"
+    except LangDetectException:
+        return False
+
+
+def no_gate(text):
+    return True
+
+
+LANGUAGE_GATES = {
+    "heuristic": french_heuristic_gate,
+    "langdetect": langdetect_gate,
+    "none": no_gate,
+}
+
+
+def get_language_gate(name):
+    if name not in LANGUAGE_GATES:
+        raise ValueError(f"Unknown language gate '{name}', expected one of {', '.join(LANGUAGE_GATES)}")
+    return LANGUAGE_GATES[name]
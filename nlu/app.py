@@ -1,36 +1,157 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
 from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+import hashlib
 import os
+import time
+import joblib
+import torch
+from response_cache import ResponseCache
+from micro_batcher import MicroBatcher
+from onnx_backend import OnnxTextClassifier
+from joint_model import JointIntentEntityModel, JointPredictor
 
 app = Flask(__name__)
 
+REQUEST_DURATION = Histogram(
+    'nlu_request_duration_seconds',
+    'Time to answer a NLU service request',
+    ['endpoint']
+)
+STAGE_DURATION = Histogram(
+    'nlu_stage_duration_seconds',
+    'Time spent in each NLU processing stage',
+    ['stage']
+)
+
+# Responses cached per (model, normalized text), 0 disables the cache
+CACHE_SIZE = int(os.getenv('NLU_CACHE_SIZE', '10000'))
+
+# Concurrent requests to a model are grouped into a single forward pass of up to
+# MAX_BATCH_SIZE texts, waiting at most MAX_WAIT_MS after the first one
+MICRO_BATCHING = os.getenv('NLU_MICRO_BATCHING', 'true').lower() == 'true'
+MAX_BATCH_SIZE = int(os.getenv('NLU_MAX_BATCH_SIZE', '16'))
+MAX_WAIT_MS = float(os.getenv('NLU_MAX_WAIT_MS', '5'))
+
+# Serve int8 dynamically quantized Linear layers instead of fp32 (CPU only),
+# see machine_learning/nlu/evaluate_quantization.py for the accuracy/latency trade-off
+QUANTIZE = os.getenv('NLU_QUANTIZE', 'false').lower() == 'true'
+
+# Inference engine: torch (transformers pipeline) or onnx (onnxruntime on the exported
+# model.onnx, falling back to torch for models trained before the export step)
+BACKEND = os.getenv('NLU_BACKEND', 'torch')
+ONNX_THREADS = int(os.getenv('NLU_ONNX_THREADS', '0'))
+
+# Queries are truncated to MAX_LENGTH tokens and batches padded to their longest text,
+# keep it equal to the max_length used for training (see machine_learning/nlu/train_and_test.py)
+MAX_LENGTH = int(os.getenv('NLU_MAX_LENGTH', '128'))
+
+# TF-IDF + logistic regression trained with the model (cascade.joblib): it answers when
+# its confidence reaches the calibrated threshold, the transformer handles the rest
+CASCADE = os.getenv('NLU_CASCADE', 'true').lower() == 'true'
+CASCADE_FILE = 'cascade.joblib'
+
+def model_version(model_path):
+    """Short hash of the paths, sizes and mtimes of the model files, changes when they are replaced"""
+    digest = hashlib.sha256()
+    for directory, _, files in sorted(os.walk(model_path)):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
 class NLUService:
     def __init__(self):
+        self.nlu_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'nlu_fine_tuned_models')
         self.nlu_models = {}
+        self.batchers = {}
+        self.cascades = {}
+        self.cascade_stats = {}
+        # Returned with the predictions, callers caching them key on it
+        self.model_versions = {}
+        self.cache = ResponseCache(CACHE_SIZE)
+        # Joint models answer /predict/joint with a different response shape
+        self.joint_cache = ResponseCache(CACHE_SIZE)
         self._initialize_models()
     
     def _initialize_models(self):
-        # Load NLU models from the specified directory
-        nlu_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'nlu_fine_tuned_models')
-        
         # Check if directory exists
-        if not os.path.exists(nlu_dir):
-            os.makedirs(nlu_dir)
+        if not os.path.exists(self.nlu_dir):
+            os.makedirs(self.nlu_dir)
             
-        for model_name in os.listdir(nlu_dir):
-            model_path = os.path.join(nlu_dir, model_name)
-            if os.path.isdir(model_path):
+        # Load NLU models from the specified directory
+        for model_name in os.listdir(self.nlu_dir):
+            if os.path.isdir(os.path.join(self.nlu_dir, model_name)):
                 try:
-                    tokenizer = AutoTokenizer.from_pretrained(model_path)
-                    model = AutoModelForSequenceClassification.from_pretrained(model_path)
-                    self.nlu_models[model_name] = pipeline(
-                        "text-classification",
-                        model=model,
-                        tokenizer=tokenizer
-                    )
+                    self.load_model(model_name)
                 except Exception as e:
                     print(f"Error loading model {model_name}: {str(e)}")
     
+    def load_model(self, model_name):
+        model_path = os.path.join(self.nlu_dir, model_name)
+        if not os.path.isdir(model_path):
+            raise KeyError(f"NLU model '{model_name}' not found")
+
+        version = model_version(model_path)
+        nlu_pipeline = self._create_pipeline(model_name, model_path)
+        self.nlu_models[model_name] = nlu_pipeline
+        self.model_versions[model_name] = version
+
+        cascade_path = os.path.join(model_path, CASCADE_FILE)
+        if CASCADE and os.path.isfile(cascade_path):
+            self.cascades[model_name] = joblib.load(cascade_path)
+            self.cascade_stats[model_name] = {"answered": 0, "forwarded": 0}
+        else:
+            self.cascades.pop(model_name, None)
+
+        if MICRO_BATCHING:
+            def predict_batch(texts):
+                # The pipeline pads the texts of a batch together
+                return nlu_pipeline(texts, batch_size=len(texts), truncation=True, max_length=MAX_LENGTH)
+
+            previous_batcher = self.batchers.get(model_name)
+            self.batchers[model_name] = MicroBatcher(predict_batch, MAX_BATCH_SIZE, MAX_WAIT_MS)
+            if previous_batcher is not None:
+                previous_batcher.stop()
+        # Cached responses may come from the previous weights
+        self.cache.invalidate(model_name)
+        self.joint_cache.invalidate(model_name)
+    
+    def _create_pipeline(self, model_name, model_path):
+        if JointIntentEntityModel.is_joint(model_path):
+            print(f"Loading joint intent/entity model '{model_name}'")
+            return JointPredictor(model_path)
+
+        if BACKEND == 'onnx':
+            if OnnxTextClassifier.is_available(model_path):
+                print(f"Loading NLU model '{model_name}' with onnxruntime")
+                return OnnxTextClassifier(model_path, ONNX_THREADS)
+            print(f"No ONNX graph for NLU model '{model_name}', using torch")
+
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        if QUANTIZE:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipeline(
+            "text-classification",
+            model=model,
+            tokenizer=tokenizer
+        )
+    
+    def _predict_cascade(self, model_name, text):
+        cascade = self.cascades.get(model_name)
+        if cascade is None:
+            return None
+
+        probabilities = cascade["classifier"].predict_proba([text])[0]
+        best = probabilities.argmax()
+        if probabilities[best] < cascade["threshold"]:
+            self.cascade_stats[model_name]["forwarded"] += 1
+            return None
+        self.cascade_stats[model_name]["answered"] += 1
+        return {"label": cascade["labels"][best], "score": float(probabilities[best])}
+    
     def get_nlu_model(self, model_name):
         if model_name not in self.nlu_models:
             raise KeyError(f"NLU model '{model_name}' not found")
@@ -41,14 +162,27 @@ class NLUService:
             # Get the appropriate model
             nlu_pipeline = self.get_nlu_model(model_name)
             
-            # Get prediction
-            result = nlu_pipeline(text)[0]
+            response = self.cache.get(model_name, text)
+            if response is not None:
+                return response, 200
+            
+            # Get prediction, from the cascade classifier when it is confident enough
+            with STAGE_DURATION.labels('cascade').time():
+                result = self._predict_cascade(model_name, text)
+            if result is None:
+                # Includes the wait for the other texts of the micro-batch
+                with STAGE_DURATION.labels('inference').time():
+                    if model_name in self.batchers:
+                        result = self.batchers[model_name].predict(text)
+                    else:
+                        result = nlu_pipeline(text, truncation=True, max_length=MAX_LENGTH)[0]
             
             # Format response
             response = {
                 "label": result['label'],
                 "confidence": result['score']
             }
+            self.cache.put(model_name, text, response)
             
             return response, 200
             
@@ -57,9 +191,40 @@ class NLUService:
         except Exception as e:
             return {"error": f"Processing error: {str(e)}"}, 500
 
+    def process_joint(self, text, model_name):
+        """Intent and departure/arrival cities from a single pass of a joint model"""
+        try:
+            joint_predictor = self.get_nlu_model(model_name)
+            if not isinstance(joint_predictor, JointPredictor):
+                return {"error": f"NLU model '{model_name}' is not a joint intent/entity model"}, 400
+            
+            response = self.joint_cache.get(model_name, text)
+            if response is not None:
+                return response, 200
+            
+            with STAGE_DURATION.labels('joint_inference').time():
+                response = joint_predictor.predict([text], max_length=MAX_LENGTH)[0]
+            self.joint_cache.put(model_name, text, response)
+            return response, 200
+            
+        except KeyError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": f"Processing error: {str(e)}"}, 500
+
 # Initialize the service
 nlu_service = NLUService()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    if request.endpoint != 'metrics':
+        REQUEST_DURATION.labels(request.endpoint or 'not_found').observe(time.perf_counter() - g.request_start)
+    return response
+
 @app.route('/predict', methods=['POST'])
 def predict():
     data = request.json
@@ -73,7 +238,60 @@ def predict():
         return jsonify({"error": "Missing required parameters"}), 400
     
     result, status_code = nlu_service.process_text(text, model_name)
+    if status_code == 200:
+        result = {**result, "model_version": nlu_service.model_versions.get(model_name)}
     return jsonify(result), status_code
 
+@app.route('/predict/joint', methods=['POST'])
+def predict_joint():
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    text = data.get('text')
+    model_name = data.get('model_name')
+    
+    if not text or not model_name:
+        return jsonify({"error": "Missing required parameters"}), 400
+    
+    result, status_code = nlu_service.process_joint(text, model_name)
+    if status_code == 200:
+        result = {**result, "model_version": nlu_service.model_versions.get(model_name)}
+    return jsonify(result), status_code
+
+@app.route('/models/reload', methods=['POST'])
+def reload_model():
+    data = request.json
+    if not data or not data.get('model_name'):
+        return jsonify({"error": "Missing required parameters"}), 400
+    
+    try:
+        nlu_service.load_model(data['model_name'])
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Loading error: {str(e)}"}), 500
+    return jsonify({"message": f"NLU model '{data['model_name']}' reloaded"}), 200
+
+@app.route('/models/versions', methods=['GET'])
+def model_versions():
+    return jsonify(nlu_service.model_versions), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(nlu_service.cache.stats()), 200
+
+@app.route('/cascade/stats', methods=['GET'])
+def cascade_stats():
+    return jsonify(nlu_service.cascade_stats), 200
+
+@app.route('/batching/stats', methods=['GET'])
+def batching_stats():
+    return jsonify({name: batcher.stats() for name, batcher in nlu_service.batchers.items()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
@@ -0,0 +1,123 @@
+import json
+import os
+import torch
+from torch import nn
+from transformers import AutoModel, AutoTokenizer
+
+JOINT_CONFIG_FILE = "joint_config.json"
+JOINT_HEADS_FILE = "joint_heads.pt"
+
+# Same intent labels as the NLU classifier: LABEL_0 is travel, LABEL_1 non travel
+INTENT_LABELS = ["LABEL_0", "LABEL_1"]
+ENTITY_LABELS = ["O", "B-DEPARTURE", "I-DEPARTURE", "B-ARRIVAL", "I-ARRIVAL"]
+
+
+class JointIntentEntityModel(nn.Module):
+    """One encoder pass feeding a sentence-level intent head and a token-level DEPARTURE/ARRIVAL head."""
+
+    def __init__(self, encoder, intent_labels=INTENT_LABELS, entity_labels=ENTITY_LABELS, dropout=0.1):
+        super().__init__()
+        self.encoder = encoder
+        self.intent_labels = list(intent_labels)
+        self.entity_labels = list(entity_labels)
+        self.dropout = nn.Dropout(dropout)
+        self.intent_head = nn.Linear(encoder.config.hidden_size, len(self.intent_labels))
+        self.entity_head = nn.Linear(encoder.config.hidden_size, len(self.entity_labels))
+
+    def forward(self, input_ids, attention_mask):
+        hidden_states = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        hidden_states = self.dropout(hidden_states)
+        # The intent is read from the <s> token, entities from every token
+        return self.intent_head(hidden_states[:, 0]), self.entity_head(hidden_states)
+
+    @staticmethod
+    def is_joint(model_dir):
+        return os.path.isfile(os.path.join(model_dir, JOINT_CONFIG_FILE))
+
+    def save(self, model_dir):
+        self.encoder.save_pretrained(model_dir)
+        torch.save(
+            {"intent_head": self.intent_head.state_dict(), "entity_head": self.entity_head.state_dict()},
+            os.path.join(model_dir, JOINT_HEADS_FILE)
+        )
+        with open(os.path.join(model_dir, JOINT_CONFIG_FILE), "w") as f:
+            json.dump({"intent_labels": self.intent_labels, "entity_labels": self.entity_labels}, f)
+
+    @classmethod
+    def load(cls, model_dir):
+        with open(os.path.join(model_dir, JOINT_CONFIG_FILE)) as f:
+            config = json.load(f)
+        model = cls(AutoModel.from_pretrained(model_dir), config["intent_labels"], config["entity_labels"])
+        heads = torch.load(os.path.join(model_dir, JOINT_HEADS_FILE), map_location="cpu")
+        model.intent_head.load_state_dict(heads["intent_head"])
+        model.entity_head.load_state_dict(heads["entity_head"])
+        return model.eval()
+
+
+def decode_entities(text, offsets, label_ids, entity_labels):
+    """First DEPARTURE and ARRIVAL spans of BIO token labels, as text."""
+    spans = []
+    previous_entity = None
+    for (start, end), label_id in zip(offsets, label_ids):
+        label = entity_labels[label_id]
+        # Special and padding tokens have empty offsets
+        if start == end or label == "O":
+            previous_entity = None
+            continue
+        prefix, entity = label.split("-", 1)
+        if prefix == "I" and previous_entity == entity:
+            spans[-1][2] = end
+        else:
+            spans.append([entity, start, end])
+        previous_entity = entity
+
+    entities = {"departure": None, "arrival": None}
+    for entity, start, end in spans:
+        key = entity.lower()
+        if key in entities and entities[key] is None:
+            entities[key] = text[start:end].strip()
+    return entities
+
+
+class JointPredictor:
+    """
+    Serves a joint model: predict() returns intent and cities, and calling it like the
+    text-classification pipeline returns the intent only.
+    """
+
+    def __init__(self, model_path):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = JointIntentEntityModel.load(model_path)
+
+    def predict(self, texts, truncation=True, max_length=None):
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=truncation, max_length=max_length,
+            return_offsets_mapping=True, return_tensors="pt"
+        )
+        offsets = inputs.pop("offset_mapping").tolist()
+        with torch.no_grad():
+            intent_logits, entity_logits = self.model(inputs["input_ids"], inputs["attention_mask"])
+        intent_scores = intent_logits.softmax(dim=-1)
+        entity_ids = entity_logits.argmax(dim=-1).tolist()
+
+        results = []
+        for i, text in enumerate(texts):
+            intent_id = int(intent_scores[i].argmax())
+            result = {
+                "label": self.model.intent_labels[intent_id],
+                "confidence": float(intent_scores[i][intent_id])
+            }
+            result.update(decode_entities(text, offsets[i], entity_ids[i], self.model.entity_labels))
+            results.append(result)
+        return results
+
+    def __call__(self, texts, batch_size=None, truncation=True, max_length=None):
+        if isinstance(texts, str):
+            texts = [texts]
+        batch_size = batch_size or len(texts)
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            for result in self.predict(texts[start:start + batch_size], truncation, max_length):
+                results.append({"label": result["label"], "score": result["confidence"]})
+        return results
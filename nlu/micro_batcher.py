@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Groups concurrent predictions into one batched forward pass.
+
+    Requests are collected for at most max_wait_ms after the first one, or until
+    max_batch_size texts are waiting, then predict_batch runs once on all of them
+    and each caller gets its own result back.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=16, max_wait_ms=5):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def predict(self, text, timeout=None):
+        future = Future()
+        self.requests.put((text, future))
+        return future.result(timeout)
+
+    def stop(self):
+        # Requests already queued are still served
+        self.requests.put(None)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+    def _collect(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop once this batch is served
+                self.requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.predict_batch([text for text, _ in batch])
+            except Exception:
+                # One bad input should not fail the other callers: retry them one by one
+                for text, future in batch:
+                    try:
+                        future.set_result(self.predict_batch([text])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
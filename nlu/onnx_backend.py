@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoConfig, AutoTokenizer
+
+ONNX_FILE = "model.onnx"
+
+
+class OnnxTextClassifier:
+    """
+    ONNX Runtime replacement for the text-classification pipeline.
+
+    Runs the model.onnx graph exported by machine_learning/nlu/train_and_test.py and
+    returns the same [{"label", "score"}] results, without calling torch.
+    """
+
+    def __init__(self, model_path, intra_op_threads=0):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.id2label = AutoConfig.from_pretrained(model_path).id2label
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime use one thread per physical core
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_path, ONNX_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {graph_input.name for graph_input in self.session.get_inputs()}
+
+    @staticmethod
+    def is_available(model_path):
+        return os.path.isfile(os.path.join(model_path, ONNX_FILE))
+
+    def __call__(self, texts, batch_size=None, truncation=True, max_length=None):
+        if isinstance(texts, str):
+            texts = [texts]
+        batch_size = batch_size or len(texts)
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=truncation, max_length=max_length, return_tensors="np"
+            )
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+            logits = self.session.run(["logits"], feed)[0]
+
+            # Softmax, shifted for numerical stability
+            scores = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            scores /= scores.sum(axis=-1, keepdims=True)
+            for row in scores:
+                label_id = int(row.argmax())
+                results.append({"label": self.id2label[label_id], "score": float(row[label_id])})
+        return results
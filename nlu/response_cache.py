@@ -0,0 +1,64 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Punctuation is dropped, except apostrophes and hyphens inside words ("d'aix", "saint-malo")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s'-]|(?<!\w)['-]|['-](?!\w)")
+
+
+def normalize_text(text):
+    text = text.lower().replace('’', "'")
+    return " ".join(PUNCTUATION_PATTERN.sub(" ", text).split())
+
+
+class ResponseCache:
+    """Bounded LRU cache of responses keyed on (model_name, normalized text)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name, text):
+        if not self.max_size:
+            return None
+        key = (model_name, normalize_text(text))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model_name, text, response):
+        if not self.max_size:
+            return
+        key = (model_name, normalize_text(text))
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, model_name=None):
+        # Drop the entries of one model, or everything
+        with self.lock:
+            if model_name is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == model_name]:
+                    del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
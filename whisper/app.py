@@ -1,14 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
 import os
 import whisper
 import tempfile
 import traceback
 import subprocess
 import json
+import time
 import torch
 
 app = Flask(__name__)
 
+REQUEST_DURATION = Histogram(
+    'whisper_request_duration_seconds',
+    'Time to answer a Whisper service request',
+    ['endpoint']
+)
+STAGE_DURATION = Histogram(
+    'whisper_stage_duration_seconds',
+    'Time spent in each Whisper processing stage',
+    ['stage']
+)
+
 class WhisperService:
     def __init__(self):
         self.model = None
@@ -39,9 +52,11 @@ class WhisperService:
             tmp_out_path = tmp_out.name
 
         try:
-            convert_to_wav(tmp_in_path, tmp_out_path)
+            with STAGE_DURATION.labels('convert').time():
+                convert_to_wav(tmp_in_path, tmp_out_path)
 
-            result = self.model.transcribe(tmp_out_path, language="fr")
+            with STAGE_DURATION.labels('transcribe').time():
+                result = self.model.transcribe(tmp_out_path, language="fr")
             transcript = result.get("text", "").strip()
         except Exception as e:
             print(f"Error during transcription: {str(e)}")
@@ -57,6 +72,16 @@ class WhisperService:
 
 whisper_service = WhisperService()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    if request.endpoint != 'metrics':
+        REQUEST_DURATION.labels(request.endpoint or 'not_found').observe(time.perf_counter() - g.request_start)
+    return response
+
 def convert_to_wav(input_path, output_path):
     cmd = [
         "ffmpeg", 
@@ -95,5 +120,9 @@ def health():
     else:
         return jsonify({"status": "loading"}), 503
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5003)